@@ -1,11 +1,309 @@
-﻿# ... (Full backend_app.py content from previous correct version) ...
-import uvicorn; from fastapi import FastAPI, HTTPException; from fastapi.responses import FileResponse; from pantic import BaseModel; import logging; from celery.result import AsyncResult; from tasks import run_recommendation_pipeline, celery_app
-app = FastAPI(title="Fertiler DSS API (Async)", description="API for asynchronous fertilizer recommendations.", version="0.4.0"); logging.basicConfig(level=logging.INFO); logger = logging.getLogger(__name__)
-class RecommendationRequest(BaseModel): field_id: str; budget: float; crop: str
-class JobResponse(BaseModel): job_id: str; status: str
+import os
+import time
+import asyncio
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+import json
+import logging
+import uuid
+from celery import group, states
+from celery.result import AsyncResult, GroupResult
+from budget_curve import get_field_curve
+from backend_skeleton import resolve_field_ids
+from metrics import HTTP_REQUEST_SECONDS, metrics_payload
+from job_results import (FINAL_STATUSES, JobEventHub, lookup_batch_results, lookup_result, mark_submitted,
+                         may_be_stored, sse_message)
+from tasks import run_recommendation_pipeline, run_recommendation_batch_chunk, run_budget_curve_pipeline, celery_app
+
+app = FastAPI(title="Fertiler DSS API (Async)", description="API for asynchronous fertilizer recommendations.", version="0.4.0")
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "50"))
+BATCH_MAX_CHUNK_SIZE = 500
+JOB_EVENTS_KEEPALIVE_S = float(os.getenv("JOB_EVENTS_KEEPALIVE_S", "15"))
+JOB_EVENTS_MAX_WAIT_S = float(os.getenv("JOB_EVENTS_MAX_WAIT_S", "600"))
+
+job_event_hub = JobEventHub()
+
+
+def result_ttl_s():
+    expires = celery_app.conf.result_expires
+    return expires.total_seconds() if hasattr(expires, "total_seconds") else float(expires or 86400)
+
+
+class RecommendationRequest(BaseModel):
+    field_id: str
+    budget: float
+    crop: str
+    mode: str = "solve"
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class BatchRecommendationRequest(BaseModel):
+    crop: str
+    farm_id: Optional[str] = None
+    field_ids: Optional[List[str]] = None
+    polygon_wkt: Optional[str] = None
+    budget: Optional[float] = None
+    budgets: Dict[str, float] = {}
+    chunk_size: Optional[int] = None
+
+
+class BatchJobResponse(BaseModel):
+    batch_id: str
+    status: str
+    total_fields: int
+    total_chunks: int
+    unresolved_field_ids: List[str] = []
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    # Label by route template, not raw path, so job ids do not create new series
+    HTTP_REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
+
 @app.get("/", include_in_schema=False)
-async def get_index_html(): return FileResponse("index.html")
+async def get_index_html():
+    return FileResponse("index.html")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = await asyncio.to_thread(metrics_payload, celery_app.conf.broker_url)
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/recommend/request", response_model=JobResponse)
-async def request_recommendation(request: RecommendationRequest): logger.info(f"Received job: field={request.field_id}, crop={request.crop}, budget={request.budget}"); if request.budget <= 0: raise HTTPException(status_code=400, detail="Budget must be positive."); try: job = run_recommendation_pipeline.delay(request.field_id, request.budget, request.crop); logger.info(f"Job dispatched: {job.id}"); return JobResponse(job_id=job.id, status="PENDING"); except Exception as e: logger.error(f"Dispatch error: {e}"); raise HTTPException(status_code=500, detail=str(e))
+async def request_recommendation(request: RecommendationRequest):
+    logger.info(f"Received job: field={request.field_id}, crop={request.crop}, budget={request.budget}")
+    if request.budget <= 0:
+        raise HTTPException(status_code=400, detail="Budget must be positive.")
+    if request.mode not in ("solve", "curve"):
+        raise HTTPException(status_code=400, detail="Mode must be 'solve' or 'curve'.")
+    try:
+        job = run_recommendation_pipeline.delay(request.field_id, request.budget, request.crop, request.mode)
+        mark_submitted(job.id, result_ttl_s())
+        logger.info(f"Job dispatched: {job.id}")
+        return JobResponse(job_id=job.id, status="PENDING")
+    except Exception as e:
+        logger.error(f"Dispatch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def job_status(job_id):
+    """Job status and result from the Celery (Redis) backend, falling back to the recommendation table.
+
+    Celery reports queued, unknown and expired ids alike as PENDING (running ones are STARTED), so
+    PostgreSQL is only consulted for PENDING ids that Redis no longer remembers dispatching.
+    """
+    job = AsyncResult(job_id, app=celery_app)
+    state = job.state
+    if state == "SUCCESS":
+        return {"status": "SUCCESS", "data": job.result}
+    if state == "FAILURE":
+        logger.error(f"Job {job_id} failed: {job.result}")
+        return {"status": "FAILED", "data": str(job.result)}
+    if state == "PENDING" and may_be_stored(job_id):
+        try:
+            stored = lookup_result(job_id)
+        except Exception as e:
+            logger.error(f"Stored result lookup failed for {job_id}: {e}")
+            stored = None
+        if stored is not None:
+            status, data = stored
+            if status == "failed":
+                return {"status": "FAILED", "data": data.get("error")}
+            return {"status": "SUCCESS", "data": data}
+    return {"status": state, "data": None}
+
+
 @app.get("/recommend/result/{job_id}")
-async def get_job_result(job_id: str): logger.debug(f"Checking job: {job_id}"); job = AsyncResult(job_id, app=celery_app); if not job.ready(): return {"status": job.status, "data": None}; if job.failed(): logger.error(f"Job {job_id} failed: {job.result}"); return {"status": "FAILED", "data": str(job.result)}; if job.successful(): logger.info(f"Job {job_id} success."); return {"status": "SUCCESS", "data": job.get()}; return {"status": job.status, "data": None}
+async def get_job_result(job_id: str):
+    logger.debug(f"Checking job: {job_id}")
+    return await asyncio.to_thread(job_status, job_id)
+
+
+@app.get("/recommend/events/{job_id}")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events for a job: status transitions as the worker publishes them, then the result.
+
+    The stream subscribes before reading the current status, so a job that finishes in between is
+    still reported, and it closes after the final SUCCESS or FAILED event.
+    """
+    async def events():
+        queue = await job_event_hub.subscribe(job_id)
+        try:
+            current = await asyncio.to_thread(job_status, job_id)
+            yield sse_message(dict(current, job_id=job_id))
+            if current["status"] in FINAL_STATUSES:
+                return
+            deadline = time.monotonic() + JOB_EVENTS_MAX_WAIT_S
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), JOB_EVENTS_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_message(event)
+                if event["status"] in FINAL_STATUSES:
+                    return
+        finally:
+            job_event_hub.unsubscribe(job_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/recommend/curve/{field_id}")
+async def get_budget_curve(field_id: str, crop: str):
+    """Whole optimal-NPK / profit-vs-budget curve for a field in one request.
+
+    A cached curve is returned directly; otherwise a job is dispatched and its id returned, to be
+    followed on /recommend/events/{job_id} or polled on /recommend/result/{job_id}.
+    """
+    curve = await asyncio.to_thread(get_field_curve, field_id, crop)
+    if curve is not None:
+        return {"status": "SUCCESS", "cached": True, "data": dict(curve, field_id=field_id)}
+    try:
+        job = run_budget_curve_pipeline.delay(field_id, crop)
+        mark_submitted(job.id, result_ttl_s())
+        logger.info(f"Budget curve job dispatched: {job.id}")
+        return {"status": "PENDING", "cached": False, "job_id": job.id, "data": None}
+    except Exception as e:
+        logger.error(f"Dispatch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def dispatch_batch(chunks, crop, total_fields):
+    batch_id = str(uuid.uuid4())
+    result = group(run_recommendation_batch_chunk.s(chunk, crop) for chunk in chunks).apply_async(group_id=batch_id)
+    result.save()
+    celery_app.backend.set(f"batch-meta-{batch_id}", json.dumps({"total_fields": total_fields, "crop": crop}))
+    return batch_id
+
+
+@app.post("/recommend/batch", response_model=BatchJobResponse)
+async def request_batch_recommendation(request: BatchRecommendationRequest):
+    logger.info(f"Received batch: farm={request.farm_id}, fields={len(request.field_ids or [])}, polygon={request.polygon_wkt is not None}, crop={request.crop}")
+    try:
+        # resolve_field_ids returns canonical UUID strings, so requested ids and budget keys are matched in that form
+        budgets = {str(uuid.UUID(k)): v for k, v in request.budgets.items()}
+        requested = {str(uuid.UUID(f)) for f in request.field_ids or []}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="field_ids and budgets keys must be UUIDs")
+    try:
+        field_ids = await asyncio.to_thread(resolve_field_ids, request.farm_id, request.field_ids, request.polygon_wkt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    unresolved = sorted(requested - set(field_ids))
+    if not field_ids:
+        if unresolved:
+            raise HTTPException(status_code=400, detail=f"None of the requested fields exist in the selection: {unresolved}")
+        raise HTTPException(status_code=404, detail="No fields matched the batch selection.")
+    if unresolved:
+        logger.warning(f"Batch skips {len(unresolved)} unresolved field ids: {unresolved}")
+    field_budgets = []
+    for field_id in field_ids:
+        budget = budgets.get(field_id, request.budget)
+        if budget is None or budget <= 0:
+            raise HTTPException(status_code=400, detail=f"Budget for field {field_id} must be positive.")
+        field_budgets.append([field_id, budget])
+    chunk_size = max(1, min(request.chunk_size or BATCH_CHUNK_SIZE, BATCH_MAX_CHUNK_SIZE))
+    chunks = [field_budgets[i:i + chunk_size] for i in range(0, len(field_budgets), chunk_size)]
+    try:
+        batch_id = await asyncio.to_thread(dispatch_batch, chunks, request.crop, len(field_budgets))
+        logger.info(f"Batch dispatched: {batch_id} ({len(field_budgets)} fields in {len(chunks)} chunks)")
+        return BatchJobResponse(batch_id=batch_id, status="PENDING", total_fields=len(field_budgets), total_chunks=len(chunks),
+                                unresolved_field_ids=unresolved)
+    except Exception as e:
+        logger.error(f"Batch dispatch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def stored_batch_result(batch_id):
+    """Batch status from the recommendation table once the Celery group has expired from Redis.
+
+    Only per-field rows are stored, so chunk counts are unknown and a chunk that failed as a whole
+    is missing from the totals.
+    """
+    try:
+        rows = lookup_batch_results(batch_id)
+    except Exception as e:
+        logger.error(f"Stored batch lookup failed for {batch_id}: {e}")
+        rows = []
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Unknown batch {batch_id}")
+    results = [data for _, data in rows]
+    return {
+        "status": "SUCCESS",
+        "total_fields": len(results),
+        "completed_fields": len(results),
+        "failed_fields": sum(1 for status, _ in rows if status == "failed"),
+        "total_chunks": None,
+        "completed_chunks": None,
+        "failed_chunks": None,
+        "timings_ms": None,
+        "data": results,
+    }
+
+
+def batch_status(batch_id):
+    """Batch progress and results, reading every chunk's stored state with a single MGET.
+
+    `timings_ms` sums each stage's time over the chunks completed so far.
+    """
+    result = GroupResult.restore(batch_id, app=celery_app)
+    if result is None:
+        return stored_batch_result(batch_id)
+    backend = celery_app.backend
+    meta = json.loads(backend.get(f"batch-meta-{batch_id}") or "{}")
+    keys = [backend.get_key_for_task(chunk.id) for chunk in result.results]
+    chunk_metas = backend.mget(keys)
+    if hasattr(chunk_metas, "get"):  # cache backends return a dict of the keys they found
+        chunk_metas = [chunk_metas.get(k) for k in keys]
+    results, timings, succeeded_chunks, failed_chunks = [], {}, 0, 0
+    for raw in chunk_metas:
+        if raw is None:
+            continue
+        chunk = backend.decode_result(raw)
+        if chunk["status"] == "SUCCESS":
+            succeeded_chunks += 1
+            results.extend(chunk["result"]["results"])
+            for stage, ms in chunk["result"]["timings_ms"].items():
+                timings[stage] = round(timings.get(stage, 0.0) + ms, 2)
+        elif chunk["status"] in states.PROPAGATE_STATES:
+            failed_chunks += 1
+    failed_fields = sum(1 for r in results if "error" in r)
+    completed_chunks = succeeded_chunks + failed_chunks
+    if completed_chunks < len(result.results):
+        status = "PROGRESS" if completed_chunks else "PENDING"
+    else:
+        status = "SUCCESS" if not failed_chunks else "PARTIAL"
+    return {
+        "status": status,
+        "total_fields": meta.get("total_fields"),
+        "completed_fields": len(results),
+        "failed_fields": failed_fields,
+        "total_chunks": len(result.results),
+        "completed_chunks": completed_chunks,
+        "failed_chunks": failed_chunks,
+        "timings_ms": timings,
+        "data": results,
+    }
+
+
+@app.get("/recommend/batch/{batch_id}")
+async def get_batch_result(batch_id: str):
+    return await asyncio.to_thread(batch_status, batch_id)
@@ -1,62 +1,220 @@
-﻿import pandas as pd
-from fastapi import FastAPI, HTTPException
+﻿import os
+import uuid
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+import pandas as pd
+import asyncpg
+import httpx
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from sqlalchemy import create_engine
-from scripts.fetch_imd import summarize_imd
+from sqlalchemy.exc import DataError, InternalError
+from scripts.fetch_imd import summarize_imd, summarize_imd_async
+from scripts.weather_cache import WEATHER_HTTP_POOL_SIZE, fetch_daily_async
+from optimizer import optimize_field, warm_optimizer_process
+from metrics import timed, timings_ms
 
 DATABASE_URL = "postgresql+psycopg2://fert_user:fert_pass@db:5432/fertdss"
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+engine = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True, pool_recycle=1800)
 
-app = FastAPI(title="Fertilizer DSS with IMD Integration")
+# /recommendations/sync runs on an async stack: an asyncpg pool, one shared httpx client and a
+# process pool for the optimizer, each with its own concurrency limit
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("+psycopg2", ""))
+SYNC_DB_POOL_MIN = int(os.getenv("SYNC_DB_POOL_MIN", "2"))
+SYNC_DB_POOL_MAX = int(os.getenv("SYNC_DB_POOL_MAX", "20"))
+SYNC_DB_TIMEOUT_S = float(os.getenv("SYNC_DB_TIMEOUT_S", "10"))
+SYNC_WEATHER_CONCURRENCY = int(os.getenv("SYNC_WEATHER_CONCURRENCY", str(WEATHER_HTTP_POOL_SIZE)))
+SYNC_WEATHER_TIMEOUT_S = float(os.getenv("WEATHER_HTTP_TIMEOUT_S", "30"))
+SYNC_OPTIMIZER_PROCESSES = int(os.getenv("SYNC_OPTIMIZER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+SYNC_OPTIMIZER_MAX_PENDING = int(os.getenv("SYNC_OPTIMIZER_MAX_PENDING", "64"))
+SYNC_QUEUE_WAIT_S = float(os.getenv("SYNC_QUEUE_WAIT_S", "5"))
+SYNC_REQUEST_TIMEOUT_S = float(os.getenv("SYNC_REQUEST_TIMEOUT_S", "60"))
+
+@asynccontextmanager
+async def lifespan(app):
+    state = app.state
+    state.db = await asyncpg.create_pool(ASYNC_DATABASE_URL, min_size=SYNC_DB_POOL_MIN, max_size=SYNC_DB_POOL_MAX,
+                                         command_timeout=SYNC_DB_TIMEOUT_S)
+    limits = httpx.Limits(max_connections=SYNC_WEATHER_CONCURRENCY, max_keepalive_connections=SYNC_WEATHER_CONCURRENCY)
+    state.http = httpx.AsyncClient(timeout=httpx.Timeout(SYNC_WEATHER_TIMEOUT_S, connect=5.0),
+                                   transport=httpx.AsyncHTTPTransport(limits=limits, retries=2))
+    # Workers start lazily, once the event loop, asyncpg and httpx threads exist, so they are
+    # launched from a forkserver rather than forked from this multi-threaded process
+    state.optimizer_pool = ProcessPoolExecutor(max_workers=SYNC_OPTIMIZER_PROCESSES,
+                                               mp_context=multiprocessing.get_context("forkserver"),
+                                               initializer=warm_optimizer_process)
+    state.limits = {"weather API": asyncio.Semaphore(SYNC_WEATHER_CONCURRENCY),
+                    "optimizer": asyncio.Semaphore(SYNC_OPTIMIZER_MAX_PENDING)}
+    try:
+        yield
+    finally:
+        await state.http.aclose()
+        await state.db.close()
+        state.optimizer_pool.shutdown(cancel_futures=True)
+
+app = FastAPI(title="Fertilizer DSS with IMD Integration", lifespan=lifespan)
 
 class RecommendationRequest(BaseModel):
     field_id: str
     crop: str
     budget_inr: float
 
-def featurize_field(field_id: str, crop: str):
-    q = """
-        SELECT f.lat, f.lon, f.area_ha, gs.season_year, gs.crop, gs.planting_date, gs.harvest_date,
-               (gs.soil_snapshot->>'n_kg_ha')::float as soil_n,
-               (gs.soil_snapshot->>'p_olsen_mg_kg')::float as soil_p,
-               (gs.soil_snapshot->>'k_mg_kg')::float as soil_k,
-               (gs.soil_snapshot->>'ph')::float as ph
-        FROM field f
-        JOIN growing_season gs ON f.id = gs.field_id
-        WHERE f.id = %(field_id)s
-        ORDER BY gs.season_year DESC
-        LIMIT 1
-    """
-    df = pd.read_sql(q, engine, params={"field_id": field_id})
-    if df.empty:
-        raise ValueError(f"No field data found for {field_id}")
+FEATURES_QUERY = """
+    SELECT s.field_id::text AS field_id, ST_Y(f.centroid) AS lat, ST_X(f.centroid) AS lon, f.area_ha,
+           s.season_year, s.crop, s.planting_date, s.harvest_date,
+           s.soil_n, s.soil_p, s.soil_k, s.ph, s.mean_ndvi
+    FROM field_latest_features s
+    JOIN field f ON f.id = s.field_id
+    WHERE s.field_id = ANY(%(field_ids)s::uuid[])
+"""
+
+FEATURE_QUERY_ASYNC = """
+    SELECT s.field_id::text AS field_id, ST_Y(f.centroid) AS lat, ST_X(f.centroid) AS lon, f.area_ha::float AS area_ha,
+           s.season_year, s.crop, s.planting_date, s.harvest_date,
+           s.soil_n, s.soil_p, s.soil_k, s.ph, s.mean_ndvi
+    FROM field_latest_features s
+    JOIN field f ON f.id = s.field_id
+    WHERE s.field_id = $1::uuid
+"""
 
-    lat, lon = df.iloc[0]["lat"], df.iloc[0]["lon"]
-    planting_date = pd.to_datetime(df.iloc[0]["planting_date"]).strftime("%Y-%m-%d")
-    harvest_date = pd.to_datetime(df.iloc[0]["harvest_date"]).strftime("%Y-%m-%d")
+def _add_weather(row):
+    planting_date = pd.to_datetime(row["planting_date"]).strftime("%Y-%m-%d")
+    harvest_date = pd.to_datetime(row["harvest_date"]).strftime("%Y-%m-%d")
 
     # 🔗 Fetch live IMD-style weather data
-    weather = summarize_imd(lat, lon, planting_date, harvest_date)
+    weather = summarize_imd(row["lat"], row["lon"], planting_date, harvest_date)
 
-    df["total_rainfall"] = weather["total_rainfall_mm"]
-    df["gdd"] = weather["gdd"]
-    df["mean_temp"] = weather["mean_temp"]
+    row["total_rainfall"] = weather["total_rainfall_mm"]
+    row["gdd"] = weather["gdd"]
+    row["mean_temp"] = weather["mean_temp"]
+    return row
 
-    return df, df.to_dict(orient="records")[0]
+def featurize_fields(field_ids, crop=None, timings=None):
+    """Latest-season features for many fields with a single query on field_latest_features.
 
-@app.post("/recommendations/sync")
-async def request_recommendation_sync(req: RecommendationRequest):
+    Returns (features, errors): dicts keyed by field id holding the feature dict, or the reason
+    a field could not be featurized. Query and weather seconds are added to `timings` if given.
+    """
+    field_ids = [str(f) for f in field_ids]
+    with timed("featurize", timings):
+        df = pd.read_sql(FEATURES_QUERY, engine, params={"field_ids": field_ids})
+    features, errors = {}, {}
+    for row in df.to_dict(orient="records"):
+        try:
+            with timed("weather", timings):
+                features[row["field_id"]] = _add_weather(row)
+        except Exception as e:
+            errors[row["field_id"]] = str(e)
+    for field_id in field_ids:
+        if field_id not in features and field_id not in errors:
+            errors[field_id] = f"No field data found for {field_id}"
+    return features, errors
+
+def featurize_field(field_id: str, crop: str, timings=None):
+    features, errors = featurize_fields([field_id], crop, timings)
+    if field_id in errors:
+        raise ValueError(errors[field_id])
+    df = pd.DataFrame([features[field_id]])
+    return df, features[field_id]
+
+def resolve_field_ids(farm_id=None, field_ids=None, polygon_wkt=None):
+    """Field ids selected by a farm, an explicit list and/or a WGS84 polygon (intersected)."""
+    clauses, params = [], {}
+    try:
+        if farm_id:
+            clauses.append("f.farm_id = %(farm_id)s")
+            params["farm_id"] = str(uuid.UUID(str(farm_id)))
+        if field_ids:
+            clauses.append("f.id = ANY(%(field_ids)s::uuid[])")
+            params["field_ids"] = [str(uuid.UUID(str(f))) for f in field_ids]
+    except ValueError:
+        raise ValueError("farm_id and field_ids must be UUIDs")
+    if polygon_wkt:
+        # ST_Intersects is index-assisted, so field_geom_idx prunes candidates by bounding box
+        clauses.append("ST_Intersects(f.geom, ST_GeomFromText(%(wkt)s, 4326))")
+        params["wkt"] = polygon_wkt
+    if not clauses:
+        raise ValueError("One of farm_id, field_ids or polygon_wkt is required")
+    q = f"SELECT f.id::text AS id FROM field f WHERE {' AND '.join(clauses)} ORDER BY f.id"
+    try:
+        return pd.read_sql(q, engine, params=params)["id"].tolist()
+    except (DataError, InternalError) as e:
+        # PostGIS reports unparsable WKT as an internal error (XX000)
+        raise ValueError(f"Invalid polygon_wkt: {e.orig}") from e
+
+@asynccontextmanager
+async def limited(state, upstream):
+    """Hold one of `upstream`'s slots, or fail with 503 if none frees up within SYNC_QUEUE_WAIT_S."""
+    semaphore = state.limits[upstream]
     try:
-        X_df, X_dict = featurize_field(req.field_id, req.crop)
-    except Exception as e:
+        await asyncio.wait_for(semaphore.acquire(), SYNC_QUEUE_WAIT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail=f"{upstream} is saturated, retry later")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+async def featurize_field_async(state, field_id: str, timings=None):
+    """`featurize_field` on the async stack; returns the feature dict."""
+    try:
+        field_uuid = uuid.UUID(field_id)
+    except ValueError:
+        raise ValueError(f"No field data found for {field_id}")
+    with timed("featurize", timings):
+        try:
+            async with state.db.acquire(timeout=SYNC_DB_TIMEOUT_S) as conn:
+                record = await conn.fetchrow(FEATURE_QUERY_ASYNC, field_uuid)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Database pool is saturated, retry later")
+    if record is None:
+        raise ValueError(f"No field data found for {field_id}")
+    row = dict(record)
+    if row["planting_date"] is None or row["harvest_date"] is None:
+        raise ValueError(f"Missing planting or harvest date for {field_id}")
+
+    async def fetch(lat, lon, start_date, end_date):
+        async with limited(state, "weather API"):
+            return await fetch_daily_async(state.http, lat, lon, start_date, end_date)
+
+    with timed("weather", timings):
+        try:
+            weather = await summarize_imd_async(row["lat"], row["lon"], row["planting_date"].isoformat(),
+                                                row["harvest_date"].isoformat(), fetch)
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Weather API timed out")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Weather API error: {e}")
+    row["total_rainfall"] = weather["total_rainfall_mm"]
+    row["gdd"] = weather["gdd"]
+    row["mean_temp"] = weather["mean_temp"]
+    return row
+
+async def recommend_sync(state, req, timings):
+    try:
+        X_dict = await featurize_field_async(state, req.field_id, timings)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    async with limited(state, "optimizer"):
+        with timed("optimize", timings):
+            opt = await asyncio.get_running_loop().run_in_executor(
+                state.optimizer_pool, optimize_field, req.budget_inr, X_dict, req.crop)
+    return X_dict, opt
 
-    # 🔮 Simulated recommendation
-    rec = {
-        "n_recommendation_kg_ha": 120,
-        "p_recommendation_kg_ha": 60,
-        "k_recommendation_kg_ha": 40,
-    }
+@app.post("/recommendations/sync")
+async def request_recommendation_sync(req: RecommendationRequest, request: Request):
+    if req.budget_inr <= 0:
+        raise HTTPException(status_code=400, detail="Budget must be positive.")
+    timings = {}
+    with timed("end_to_end", timings):
+        try:
+            X_dict, opt = await asyncio.wait_for(recommend_sync(request.app.state, req, timings), SYNC_REQUEST_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Recommendation took longer than {SYNC_REQUEST_TIMEOUT_S:g}s")
 
     return {
         "status": "ok",
@@ -65,5 +223,13 @@ async def request_recommendation_sync(req: RecommendationRequest):
             "gdd": X_dict["gdd"],
             "mean_temp": X_dict["mean_temp"]
         },
-        "recommendations": rec
+        "recommendations": {
+            "n_recommendation_kg_ha": opt["N"],
+            "p_recommendation_kg_ha": opt["P"],
+            "k_recommendation_kg_ha": opt["K"],
+            "expected_yield_mean": opt["yield_mean_at_optimum"],
+            "expected_yield_std_dev": opt["yield_std_dev_at_optimum"],
+            "optimizer_status": opt["optimizer_status"],
+        },
+        "timings_ms": timings_ms(timings),
     }
@@ -0,0 +1,293 @@
+"""Reproducible, offline benchmarks for the recommendation pipeline.
+
+Everything runs in-process without network or services: weather comes from the local archive
+stand-in replaying bench/fixtures/weather, featurization reads a SQLite stand-in seeded from
+scripts/sample_growing_season_aug.csv, Celery runs eagerly with an in-memory result backend and
+the FastAPI app is driven through its TestClient. Budget-curve scenarios run when `fakeredis`
+is installed.
+
+    python bench/run_benchmarks.py                   # run and print a report
+    python bench/run_benchmarks.py --save-baseline   # also write the JSON baseline
+    python bench/run_benchmarks.py --compare         # exit 1 if a scenario regressed
+"""
+import argparse
+import json
+import logging
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+BENCH_DIR = ROOT / "bench"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+DEFAULT_BASELINE = BENCH_DIR / "baselines" / "baseline.json"
+SEED = 1234
+
+
+def summarize_latencies(name, latencies_s, units=1, extra=None):
+    """Latency percentiles in ms plus throughput in `units` (e.g. fields) per second."""
+    lat_ms = np.asarray(latencies_s) * 1000.0
+    total_s = float(np.sum(latencies_s))
+    result = {
+        "name": name,
+        "calls": len(lat_ms),
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p90_ms": float(np.percentile(lat_ms, 90)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+        "mean_ms": float(lat_ms.mean()),
+        "max_ms": float(lat_ms.max()),
+        "throughput_per_s": len(lat_ms) * units / total_s if total_s > 0 else float("inf"),
+    }
+    result.update(extra or {})
+    return result
+
+
+def measure(name, fn, calls, warmup=3, units=1, extra=None):
+    for _ in range(warmup):
+        fn(0)
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize_latencies(name, latencies, units, extra)
+
+
+def spread(values):
+    values = np.asarray(values, dtype=float)
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)), "max": float(values.max())}
+
+
+def seed_sqlite(path, n_fields):
+    """SQLite stand-in for field + field_latest_features built from the sample CSVs.
+
+    The three sample fields are cloned with jittered coordinates to reach `n_fields`.
+    """
+    from sqlalchemy import create_engine
+    fields = pd.read_csv(ROOT / "scripts" / "sample_fields.csv", encoding="utf-8-sig").set_index("name")
+    seasons = pd.read_csv(ROOT / "scripts" / "sample_growing_season_aug.csv", encoding="utf-8-sig")
+    latest = seasons.sort_values("season_year").groupby("field_name").tail(1).reset_index(drop=True)
+    rng = np.random.default_rng(SEED)
+    field_rows, feature_rows = [], []
+    for i in range(n_fields):
+        season = latest.iloc[i % len(latest)]
+        base = fields.loc[season["field_name"]]
+        field_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench-field-{i}"))
+        jitter = rng.uniform(-0.3, 0.3, 2) if i >= len(latest) else (0.0, 0.0)
+        field_rows.append({"id": field_id, "name": f"{season['field_name']}_{i}", "lat": base["lat"] + jitter[0],
+                           "lon": base["lon"] + jitter[1], "area_ha": base["area_ha"]})
+        feature_rows.append({"field_id": field_id, "season_year": int(season["season_year"]), "crop": season["crop"],
+                             "planting_date": season["planting_date"], "harvest_date": season["harvest_date"],
+                             "soil_n": season["soil_n"], "soil_p": season["soil_p"], "soil_k": season["soil_k"],
+                             "ph": season["ph"], "mean_ndvi": season["mean_ndvi"]})
+    engine = create_engine(f"sqlite:///{path}")
+    pd.DataFrame(field_rows).to_sql("field", engine, index=False)
+    pd.DataFrame(feature_rows).to_sql("field_latest_features", engine, index=False)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX idx_flf_field_year ON field_latest_features(field_id, season_year)")
+    return engine, [r["id"] for r in field_rows], [r["crop"] for r in feature_rows]
+
+
+def sqlite_features_query():
+    from sqlalchemy import bindparam, text
+    return text("""
+        SELECT s.field_id AS field_id, f.lat, f.lon, f.area_ha,
+               s.season_year, s.crop, s.planting_date, s.harvest_date,
+               s.soil_n, s.soil_p, s.soil_k, s.ph, s.mean_ndvi
+        FROM field_latest_features s
+        JOIN field f ON f.id = s.field_id
+        WHERE s.field_id IN :field_ids
+    """).bindparams(bindparam("field_ids", expanding=True))
+
+
+def run_all(args, workdir):
+    from mock_weather_server import MockWeatherHandler, start_server
+    server, api_url = start_server(fixtures_dir=BENCH_DIR / "fixtures" / "weather")
+    os.environ["WEATHER_API_URL"] = api_url
+    os.environ["WEATHER_CACHE_PATH"] = str(workdir / "weather_cache.sqlite")
+    os.environ["YIELD_MODEL_PATH"] = args.model or str(workdir / "no_model.joblib")
+    # No Redis pub/sub or PostgreSQL here: job events and durable result writes are switched off
+    os.environ["JOB_EVENTS_ENABLED"] = "0"
+    os.environ["RESULT_PERSIST_ENABLED"] = "0"
+    # Weather scenarios time the fetch/cache path; the climate store has its own scenario
+    os.environ["WEATHER_USE_CLIMATE_STORE"] = "0"
+    os.environ["CLIMATE_STORE_PATH"] = str(workdir / "climate_store")
+
+    import optimizer
+    import backend_skeleton
+    import tasks
+    from scripts import weather_cache
+    from scripts.fetch_imd import summarize_imd
+
+    rng = np.random.default_rng(SEED)
+    results = []
+
+    # Optimizer: scalar path across budget and feature ranges, then one large batch
+    budgets = rng.uniform(500, 30000, args.optimizer_calls)
+    features = [{"soil_n": rng.uniform(10, 80), "total_rainfall": rng.uniform(200, 1500), "gdd": rng.uniform(800, 3000)}
+                for _ in range(args.optimizer_calls)]
+    stats = optimizer.optimize_npk_batch(budgets, features)
+    results.append(measure("optimizer.scalar", lambda i: optimizer.optimize_npk_safety_first(budgets[i], features[i]),
+                           args.optimizer_calls, extra={"nit": spread(stats["nit"]), "nfev": spread(stats["nfev"]),
+                                                        "converged_pct": 100.0 * float(stats["success"].mean())}))
+    n_batch = args.batch_fields
+    batch_budgets = rng.uniform(500, 30000, n_batch)
+    batch_features = {"soil_n": rng.uniform(10, 80, n_batch), "total_rainfall": rng.uniform(200, 1500, n_batch),
+                      "gdd": rng.uniform(800, 3000, n_batch)}
+    stats = optimizer.optimize_npk_batch(batch_budgets, batch_features)
+    results.append(measure(f"optimizer.batch_{n_batch}", lambda i: optimizer.optimize_npk_batch(batch_budgets, batch_features),
+                           5, warmup=1, units=n_batch, extra={"nit": spread(stats["nit"]), "nfev": spread(stats["nfev"])}))
+
+    # Weather: raw fetch + summary against recorded fixtures, then the warm grid-cell cache
+    windows = [("2023-06-15", "2023-10-10"), ("2022-11-20", "2023-03-10"), ("2023-07-10", "2023-11-01")]
+    cells = [(19.2, 73.1), (18.9, 73.0), (19.0, 73.2)]
+    hits_before = MockWeatherHandler.hits
+    results.append(measure("weather.summarize_uncached",
+                           lambda i: summarize_imd(*cells[i % 3], *windows[i % 3], use_cache=False),
+                           args.weather_calls, extra={}))
+    results[-1]["upstream_hits"] = MockWeatherHandler.hits - hits_before
+    cache = weather_cache.get_weather_cache()
+    results.append(measure("weather.summarize_cached", lambda i: summarize_imd(*cells[i % 3], *windows[i % 3]),
+                           args.weather_calls * 4, extra={}))
+    results[-1]["cache"] = cache.stats()
+
+    # Climate store: build over the fixture cells, then many season windows per vectorized call
+    from scripts.climate_store import ClimateStore, build_store
+    build_store(workdir / "climate_store", (18.9, 19.2, 73.0, 73.2), "2022-01-01", "2023-12-31", source="api", verbose=False)
+    store = ClimateStore(workdir / "climate_store")
+    n_windows = 1000
+    starts = np.datetime64("2022-01-01") + rng.integers(0, 500, n_windows)
+    lats, lons = rng.uniform(18.9, 19.2, n_windows), rng.uniform(73.0, 73.2, n_windows)
+    results.append(measure(f"weather.climate_store_{n_windows}",
+                           lambda i: store.summarize_many(lats, lons, starts, starts + 120),
+                           args.weather_calls, units=n_windows))
+
+    # Featurization against the SQLite stand-in (weather cache warmed first)
+    engine, field_ids, crops = seed_sqlite(workdir / "fertdss.sqlite", args.fields)
+    backend_skeleton.engine = engine
+    backend_skeleton.FEATURES_QUERY = sqlite_features_query()
+    backend_skeleton.featurize_fields(field_ids)
+    results.append(measure("features.featurize_field", lambda i: backend_skeleton.featurize_field(field_ids[i % len(field_ids)], crops[i % len(crops)]),
+                           args.pipeline_calls))
+    results.append(measure(f"features.featurize_fields_{len(field_ids)}", lambda i: backend_skeleton.featurize_fields(field_ids),
+                           10, warmup=1, units=len(field_ids)))
+
+    # Full pipeline through Celery in eager mode with an in-memory result backend
+    tasks.celery_app.conf.update(task_always_eager=True, task_store_eager_result=True, result_backend="cache+memory://")
+    results.append(measure("pipeline.eager_solve",
+                           lambda i: tasks.run_recommendation_pipeline.delay(field_ids[i % len(field_ids)], 5000 + 100 * i, crops[i % len(crops)]).get(),
+                           args.pipeline_calls))
+    chunk = [[f, 5000.0] for f in field_ids]
+    results.append(measure(f"pipeline.eager_batch_chunk_{len(chunk)}",
+                           lambda i: tasks.run_recommendation_batch_chunk.delay(chunk, "wheat").get(),
+                           5, warmup=1, units=len(chunk)))
+
+    # API endpoints through the FastAPI test client
+    from fastapi.testclient import TestClient
+    import backend_app
+    client = TestClient(backend_app.app)
+
+    def request_and_result(i):
+        r = client.post("/recommend/request", json={"field_id": field_ids[i % len(field_ids)], "budget": 5000 + 100 * i,
+                                                     "crop": crops[i % len(crops)]})
+        r.raise_for_status()
+        data = client.get(f"/recommend/result/{r.json()['job_id']}").json()
+        assert data["status"] == "SUCCESS", data
+
+    results.append(measure("api.request_and_result", request_and_result, args.pipeline_calls))
+
+    try:
+        import fakeredis
+    except ImportError:
+        fakeredis = None
+    if fakeredis is not None:
+        import budget_curve
+        budget_curve._redis = fakeredis.FakeRedis()
+        results.append(measure("pipeline.eager_curve_mode",
+                               lambda i: tasks.run_recommendation_pipeline.delay(field_ids[i % len(field_ids)], 5000 + 100 * i, crops[i % len(crops)], "curve").get(),
+                               args.pipeline_calls))
+        results.append(measure("api.curve", lambda i: client.get(f"/recommend/curve/{field_ids[i % len(field_ids)]}",
+                                                                params={"crop": crops[i % len(crops)]}).raise_for_status(),
+                               args.pipeline_calls))
+    server.shutdown()
+    return results
+
+
+def compare(results, baseline, tolerance, abs_floor_ms):
+    """Regression messages for latency/throughput/nfev changes beyond `tolerance` (relative)."""
+    failures = []
+    base_by_name = {r["name"]: r for r in baseline["results"]}
+    for r in results:
+        b = base_by_name.get(r["name"])
+        if b is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if r[metric] > b[metric] * (1 + tolerance) and r[metric] - b[metric] > abs_floor_ms:
+                failures.append(f"{r['name']}: {metric} {r[metric]:.2f} > baseline {b[metric]:.2f}")
+        if r["throughput_per_s"] < b["throughput_per_s"] / (1 + tolerance):
+            failures.append(f"{r['name']}: throughput {r['throughput_per_s']:.1f}/s < baseline {b['throughput_per_s']:.1f}/s")
+        if "nfev" in r and "nfev" in b and r["nfev"]["mean"] > b["nfev"]["mean"] * (1 + tolerance):
+            failures.append(f"{r['name']}: mean nfev {r['nfev']['mean']:.1f} > baseline {b['nfev']['mean']:.1f}")
+    return failures
+
+
+def print_report(results):
+    print(f"{'scenario':<38}{'calls':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'thru/s':>12}")
+    for r in results:
+        print(f"{r['name']:<38}{r['calls']:>7}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_per_s']:>12.1f}")
+        for key in ("nit", "nfev"):
+            if key in r:
+                print(f"    {key}: mean {r[key]['mean']:.1f}, p50 {r[key]['p50']:.0f}, max {r[key]['max']:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recommendation pipeline benchmarks.")
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed relative slowdown")
+    parser.add_argument("--abs-floor-ms", type=float, default=1.0, help="ignore latency changes below this")
+    parser.add_argument("--output", type=pathlib.Path, help="write this run's JSON here")
+    parser.add_argument("--model", help="yield model artifact to benchmark instead of the mock model")
+    parser.add_argument("--optimizer-calls", type=int, default=200)
+    parser.add_argument("--batch-fields", type=int, default=1000)
+    parser.add_argument("--weather-calls", type=int, default=30)
+    parser.add_argument("--fields", type=int, default=60)
+    parser.add_argument("--pipeline-calls", type=int, default=100)
+    args = parser.parse_args()
+
+    # Configured before the repo modules are imported so their INFO basicConfig is a no-op
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_all(args, pathlib.Path(tmp))
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "machine": platform.machine(), "results": results}
+    print_report(results)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+            sys.exit(2)
+        failures = compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.abs_floor_ms)
+        for f in failures:
+            print(f"REGRESSION {f}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+import redis
+import optimizer
+from optimizer import optimize_fields, OPTIMIZER_FEATURES, NPK_UPPER_BOUNDS, Z_5TH_PERCENTILE
+from yield_model import get_yield_model, model_version, BASE_FEATURES
+from metrics import record_cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+BUDGET_CURVE_POINTS = int(os.getenv("BUDGET_CURVE_POINTS", "41"))
+BUDGET_CURVE_TTL_S = int(os.getenv("BUDGET_CURVE_TTL_S", str(24 * 3600)))
+BUDGET_CURVE_CACHE_MAX = int(os.getenv("BUDGET_CURVE_CACHE_MAX", "10000"))
+# The field -> curve index skips featurization, so it cannot see new growing_season rows or weather;
+# it is kept much shorter than the curves themselves
+BUDGET_CURVE_FIELD_TTL_S = int(os.getenv("BUDGET_CURVE_FIELD_TTL_S", "900"))
+
+KEY_PREFIX = "budget-curve"
+LRU_KEY = f"{KEY_PREFIX}:lru"
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _costs():
+    return np.array([optimizer.COST_PER_KG_N, optimizer.COST_PER_KG_P, optimizer.COST_PER_KG_K])
+
+
+def curve_context(model_id=None):
+    """Prices/costs and the model version: everything in a curve key besides the field.
+
+    By default the version is that of the model loaded in this process; `model_id` overrides it,
+    e.g. with yield_model.model_version() where the model is not loaded.
+    """
+    if model_id is None:
+        model = get_yield_model()
+        model_id = model.version if model is not None else "mock"
+    return {"price": optimizer.CROP_PRICE_PER_KG, "costs": _costs().tolist(), "model": model_id}
+
+
+def curve_key(X_dict, crop):
+    """Cache key from the features the optimizers read, the crop, prices/costs and the model version."""
+    features = {}
+    for name in sorted(set(OPTIMIZER_FEATURES) | set(BASE_FEATURES)):
+        value = X_dict.get(name)
+        features[name] = None if value is None or value != value else round(float(value), 6)
+    payload = dict(curve_context(), features=features, crop=crop)
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+def field_index_key(field_id, crop):
+    return f"{KEY_PREFIX}:field:{field_id}:{crop}"
+
+
+def compute_budget_curve(X_dict, crop, n_points=None):
+    """Optimal NPK, yield and 5th-percentile profit over a budget grid, solved as one batch.
+
+    The grid runs from 0 to the cost of the NPK upper bounds; larger budgets cannot buy more.
+    """
+    n_points = n_points or BUDGET_CURVE_POINTS
+    costs = _costs()
+    budgets = np.linspace(0.0, float(NPK_UPPER_BOUNDS @ costs), n_points)
+    df = optimize_fields(budgets, [X_dict] * n_points, crop)
+    npk = df[["N", "P", "K"]].to_numpy()
+    mean, std = df["yield_mean_at_optimum"].to_numpy(), df["yield_std_dev_at_optimum"].to_numpy()
+    profit_5th = optimizer.CROP_PRICE_PER_KG * (mean - Z_5TH_PERCENTILE * std) - npk @ costs
+    return {
+        "crop": crop,
+        "budgets": budgets.round(2).tolist(),
+        "N": npk[:, 0].round(2).tolist(), "P": npk[:, 1].round(2).tolist(), "K": npk[:, 2].round(2).tolist(),
+        "yield_mean": mean.round(2).tolist(), "yield_std_dev": std.round(2).tolist(),
+        "profit_5th": profit_5th.round(2).tolist(),
+        "all_converged": bool(df["success"].all()),
+        "weather_summary": {"total_rainfall_mm": X_dict.get("total_rainfall"), "gdd": X_dict.get("gdd"), "mean_temp": X_dict.get("mean_temp")},
+        "computed_at": time.time(),
+    }
+
+
+def interpolate_curve(curve, budget):
+    """Scalar optimizer-style result for any budget, linearly interpolated from a cached curve.
+
+    Interpolating between two affordable optima stays within budget because spend is linear in NPK.
+    """
+    budgets = np.asarray(curve["budgets"])
+    b = float(np.clip(budget, budgets[0], budgets[-1]))
+    at = lambda name: round(float(np.interp(b, budgets, curve[name])), 2)
+    return {
+        "N": at("N"), "P": at("P"), "K": at("K"),
+        "yield_mean_at_optimum": at("yield_mean"), "yield_std_dev_at_optimum": at("yield_std_dev"),
+        "optimizer_status": "Interpolated from budget curve",
+    }
+
+
+def cached_budget_curve(X_dict, crop, field_id=None, client=None):
+    """Budget curve for these features from Redis, computing and storing it on a miss.
+
+    Entries expire after BUDGET_CURVE_TTL_S; beyond BUDGET_CURVE_CACHE_MAX entries the least
+    recently used are evicted. With `field_id`, a field -> curve index is kept for
+    BUDGET_CURVE_FIELD_TTL_S so the curve can be served without featurizing. Returns (curve, hit).
+    """
+    r = client or get_redis()
+    key = curve_key(X_dict, crop)
+    now = time.time()
+    raw = r.get(key)
+    if raw is not None:
+        curve, hit = json.loads(raw), True
+        r.zadd(LRU_KEY, {key: now})
+    else:
+        curve, hit = compute_budget_curve(X_dict, crop), False
+        pipe = r.pipeline()
+        pipe.setex(key, BUDGET_CURVE_TTL_S, json.dumps(curve))
+        pipe.zadd(LRU_KEY, {key: now})
+        pipe.zremrangebyscore(LRU_KEY, "-inf", now - BUDGET_CURVE_TTL_S)
+        pipe.execute()
+        excess = r.zcard(LRU_KEY) - BUDGET_CURVE_CACHE_MAX
+        if excess > 0:
+            evicted = [k for k, _ in r.zpopmin(LRU_KEY, excess)]
+            r.delete(*evicted)
+            logger.info(f"[BudgetCurve] Evicted {len(evicted)} LRU curves")
+    record_cache_lookup("budget_curve", hit)
+    if field_id is not None:
+        index = json.dumps({"key": key, "context": curve_context()}, sort_keys=True)
+        r.setex(field_index_key(field_id, crop), BUDGET_CURVE_FIELD_TTL_S, index)
+    return curve, hit
+
+
+def get_field_curve(field_id, crop, client=None):
+    """Cached curve for a field via the field index, or None.
+
+    The index is ignored once the model file or prices/costs changed since it was written. The
+    model version comes from the file on disk, so the API can call this without loading the model.
+    """
+    r = client or get_redis()
+    index = r.get(field_index_key(field_id, crop))
+    key = None
+    if index is not None:
+        index = json.loads(index)
+        if index["context"] == curve_context(model_version()):
+            key = index["key"]
+    raw = r.get(key) if key is not None else None
+    record_cache_lookup("budget_curve_field", raw is not None)
+    if raw is None:
+        return None
+    r.zadd(LRU_KEY, {key: time.time()})
+    return json.loads(raw)
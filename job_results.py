@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+import redis
+import redis.asyncio as aioredis
+from psycopg2.extras import execute_values
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+JOB_EVENTS_ENABLED = os.getenv("JOB_EVENTS_ENABLED", "1") == "1"
+RESULT_PERSIST_ENABLED = os.getenv("RESULT_PERSIST_ENABLED", "1") == "1"
+RESULT_FLUSH_ROWS = int(os.getenv("RESULT_FLUSH_ROWS", "200"))
+RESULT_FLUSH_S = float(os.getenv("RESULT_FLUSH_S", "2"))
+RESULT_BUFFER_MAX = int(os.getenv("RESULT_BUFFER_MAX", "50000"))
+
+CHANNEL_PREFIX = "job-events:"
+SUBMITTED_PREFIX = "job-submitted:"
+FINAL_STATUSES = ("SUCCESS", "FAILED")
+
+# field_id is resolved against field, so an unknown id stores NULL instead of failing the whole
+# batch on the foreign key; ids are validated in ResultWriter.add, so the cast is safe and the join
+# stays on field's primary key index
+UPSERT_SQL = """
+    INSERT INTO recommendation (id, field_id, target_crop, recommended_json, status)
+    SELECT v.id::uuid, f.id, v.crop, v.result::jsonb, v.status
+    FROM (VALUES %s) AS v(id, field_id, crop, result, status)
+    LEFT JOIN field f ON f.id = v.field_id::uuid
+    ON CONFLICT (id) DO UPDATE SET recommended_json = EXCLUDED.recommended_json, status = EXCLUDED.status
+"""
+LOOKUP_SQL = "SELECT status, recommended_json FROM recommendation WHERE id = %s"
+# Uses idx_recommendation_batch (schema.sql)
+BATCH_LOOKUP_SQL = """
+    SELECT status, recommended_json FROM recommendation
+    WHERE recommended_json->>'batch_id' = %s ORDER BY recommended_json->>'field_id'
+"""
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def channel(job_id):
+    return f"{CHANNEL_PREFIX}{job_id}"
+
+
+def publish_job_event(job_id, status, data=None, client=None):
+    """Publish a job status transition; subscribers that are not listening simply miss it."""
+    if not JOB_EVENTS_ENABLED:
+        return
+    try:
+        (client or get_redis()).publish(channel(job_id), json.dumps({"job_id": job_id, "status": status, "data": data}, default=str))
+    except redis.RedisError as e:
+        logger.warning(f"[JobEvents] Publish failed for {job_id}: {e}")
+
+
+def mark_submitted(job_id, ttl_s, client=None):
+    """Remember a dispatched job for `ttl_s` (the result backend's expiry), so a PENDING status
+    for it means queued rather than unknown or expired."""
+    if not RESULT_PERSIST_ENABLED:
+        return
+    try:
+        (client or get_redis()).set(f"{SUBMITTED_PREFIX}{job_id}", 1, ex=max(1, int(ttl_s)))
+    except redis.RedisError as e:
+        logger.warning(f"[JobEvents] Could not mark {job_id} submitted: {e}")
+
+
+def may_be_stored(job_id, client=None):
+    """Whether a job Celery reports as PENDING could have a row in the recommendation table."""
+    if not RESULT_PERSIST_ENABLED:
+        return False
+    try:
+        return not (client or get_redis()).exists(f"{SUBMITTED_PREFIX}{job_id}")
+    except redis.RedisError as e:
+        logger.warning(f"[JobEvents] Submitted check failed for {job_id}: {e}")
+        return True
+
+
+class ResultWriter:
+    """Buffers finished results and upserts them into `recommendation` in bulk.
+
+    A background thread flushes every RESULT_FLUSH_S seconds, or as soon as RESULT_FLUSH_ROWS
+    rows are waiting, with one multi-row INSERT per flush. Rows that fail to write are retried
+    on the next flush, keeping at most RESULT_BUFFER_MAX while the database is unreachable.
+    """
+
+    def __init__(self, engine, flush_rows=None, flush_s=None):
+        self.engine = engine
+        self.flush_rows = flush_rows or RESULT_FLUSH_ROWS
+        self.flush_s = flush_s or RESULT_FLUSH_S
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, job_id, field_id, crop, result, status="completed"):
+        try:
+            field_id = str(uuid.UUID(str(field_id))) if field_id is not None else None
+        except ValueError:
+            field_id = None
+        row = (str(job_id), field_id, crop, json.dumps(result, default=str), status)
+        with self._lock:
+            self._rows.append(row)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.flush_rows:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            conn = self.engine.raw_connection()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, UPSERT_SQL, rows, page_size=len(rows))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.error(f"[ResultWriter] Failed to write {len(rows)} results, will retry: {e}")
+            with self._lock:
+                self._rows[:0] = rows
+                if len(self._rows) > RESULT_BUFFER_MAX:
+                    logger.error(f"[ResultWriter] Buffer full, dropping {len(self._rows) - RESULT_BUFFER_MAX} oldest results")
+                    del self._rows[:len(self._rows) - RESULT_BUFFER_MAX]
+            return 0
+        logger.info(f"[ResultWriter] Wrote {len(rows)} results in {time.perf_counter() - start:.3f}s")
+        return len(rows)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_result_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            from backend_skeleton import engine
+            _writer = ResultWriter(engine)
+        return _writer
+
+
+def flush_results():
+    """Write any buffered results now, e.g. before the process exits; returns the rows written."""
+    with _writer_lock:
+        writer = _writer
+    return writer.flush() if writer is not None else 0
+
+
+def persist_result(job_id, field_id, crop, result, status="completed"):
+    if RESULT_PERSIST_ENABLED:
+        get_result_writer().add(job_id, field_id, crop, result, status)
+
+
+def batch_result_id(batch_id, field_id):
+    """Stable recommendation id for one field of a batch, so re-running a chunk upserts in place."""
+    try:
+        namespace = uuid.UUID(str(batch_id))
+    except ValueError:
+        namespace = uuid.uuid5(uuid.NAMESPACE_URL, str(batch_id))
+    return uuid.uuid5(namespace, str(field_id))
+
+
+def lookup_result(job_id, engine=None):
+    """Stored (status, recommended_json) for a job id, or None if it was never written."""
+    try:
+        job_uuid = str(uuid.UUID(str(job_id)))
+    except ValueError:
+        return None
+    if engine is None:
+        from backend_skeleton import engine
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LOOKUP_SQL, (job_uuid,))
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    return None if row is None else (row[0], row[1])
+
+
+def lookup_batch_results(batch_id, engine=None):
+    """Stored (status, recommended_json) rows for every field of a batch, [] if none were written."""
+    if engine is None:
+        from backend_skeleton import engine
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(BATCH_LOOKUP_SQL, (str(batch_id),))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+class JobEventHub:
+    """One Redis pattern subscription per API process, fanned out to the streams waiting on each job."""
+
+    def __init__(self, url=None):
+        self.url = url or REDIS_URL
+        self._queues = defaultdict(set)
+        self._task = None
+        self._ready = None
+
+    async def subscribe(self, job_id, ready_timeout=5.0):
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        queue = asyncio.Queue()
+        self._queues[job_id].add(queue)
+        try:
+            await asyncio.wait_for(self._ready.wait(), ready_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[JobEvents] Subscription not ready; events may be missed until it reconnects")
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        queues = self._queues.get(job_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[job_id]
+
+    async def _listen(self):
+        while True:
+            try:
+                async with aioredis.Redis.from_url(self.url) as client, client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                    self._ready.set()
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        job_id = message["channel"].decode()[len(CHANNEL_PREFIX):]
+                        for queue in list(self._queues.get(job_id, ())):
+                            queue.put_nowait(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._ready.clear()
+                logger.warning(f"[JobEvents] Subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+
+def sse_message(event):
+    return f"data: {json.dumps(event, default=str)}\n\n"
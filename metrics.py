@@ -0,0 +1,137 @@
+import os
+import time
+import shutil
+import logging
+import pathlib
+from contextlib import contextmanager
+import numpy as np
+import redis
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess, start_http_server)
+from prometheus_client.core import GaugeMetricFamily
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set for prefork Celery workers so every child process writes its samples to a shared directory
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9808"))
+CELERY_QUEUES = [q for q in os.getenv("METRICS_CELERY_QUEUES", "celery").split(",") if q]
+
+STAGE_SECONDS = Histogram(
+    "fertdss_stage_seconds", "Wall-clock seconds per recommendation pipeline stage.", ["stage"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+HTTP_REQUEST_SECONDS = Histogram(
+    "fertdss_http_request_seconds", "API request latency by route.", ["method", "route", "status"])
+OPTIMIZER_FIELDS = Counter(
+    "fertdss_optimizer_fields_total",
+    "Fields optimized, by method (model grid search or mock-model fallback) and outcome.", ["method", "outcome"])
+OPTIMIZER_NIT = Counter("fertdss_optimizer_iterations_total", "Optimizer iterations summed over fields.", ["method"])
+OPTIMIZER_NFEV = Counter(
+    "fertdss_optimizer_function_evaluations_total", "Objective evaluations (or scored candidates) summed over fields.",
+    ["method"])
+CACHE_LOOKUPS = Counter("fertdss_cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+JOBS_IN_FLIGHT = Gauge("fertdss_jobs_in_flight", "Celery tasks currently executing.", ["task"], multiprocess_mode="livesum")
+
+
+@contextmanager
+def timed(stage, timings=None):
+    """Observe the block's duration in STAGE_SECONDS and add it (seconds) to `timings[stage]` if given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def timings_ms(timings):
+    return {stage: round(seconds * 1000.0, 2) for stage, seconds in timings.items()}
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_optimizer_results(method, df):
+    """Outcome counts and nit/nfev totals for an optimizer result DataFrame.
+
+    Totals rather than per-field histograms keep this O(1) in metric updates for large batches;
+    divide their rates by the fields rate for mean iterations per field.
+    """
+    n = len(df)
+    n_ok = int(np.count_nonzero(df["success"].to_numpy()))
+    if n_ok:
+        OPTIMIZER_FIELDS.labels(method, "success").inc(n_ok)
+    if n - n_ok:
+        OPTIMIZER_FIELDS.labels(method, "failure").inc(n - n_ok)
+    OPTIMIZER_NIT.labels(method).inc(int(df["nit"].to_numpy().sum()))
+    OPTIMIZER_NFEV.labels(method).inc(int(df["nfev"].to_numpy().sum()))
+
+
+class CeleryQueueDepthCollector:
+    """Broker queue lengths read at scrape time, so nothing runs on the request path."""
+
+    def __init__(self, broker_url, queues=None):
+        self.broker_url = broker_url
+        self.queues = queues or CELERY_QUEUES
+        self._client = None
+
+    def collect(self):
+        gauge = GaugeMetricFamily("fertdss_celery_queue_depth", "Messages waiting in the Celery broker queue.",
+                                  labels=["queue"])
+        try:
+            if self._client is None:
+                self._client = redis.Redis.from_url(self.broker_url, socket_timeout=2, socket_connect_timeout=2)
+            for queue in self.queues:
+                gauge.add_metric([queue], self._client.llen(queue))
+        except redis.RedisError as e:
+            logger.warning(f"[Metrics] Queue depth unavailable: {e}")
+        yield gauge
+
+
+_queue_collector = None
+
+
+def metrics_registry(broker_url=None):
+    """Registry to expose: all worker processes in multiprocess mode, else this process, plus queue depth."""
+    global _queue_collector
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        if broker_url:
+            registry.register(CeleryQueueDepthCollector(broker_url))
+        return registry
+    if broker_url and _queue_collector is None:
+        _queue_collector = CeleryQueueDepthCollector(broker_url)
+        REGISTRY.register(_queue_collector)
+    return REGISTRY
+
+
+def metrics_payload(broker_url=None):
+    """(body, content_type) for a /metrics response."""
+    return generate_latest(metrics_registry(broker_url)), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir():
+    """Drop samples left by previous worker runs; call in the parent before child processes start."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        pathlib.Path(PROMETHEUS_MULTIPROC_DIR).mkdir(parents=True, exist_ok=True)
+
+
+def start_worker_metrics_server(broker_url=None, port=None):
+    port = WORKER_METRICS_PORT if port is None else port
+    if not port:
+        return
+    if not PROMETHEUS_MULTIPROC_DIR:
+        logger.warning("[Metrics] PROMETHEUS_MULTIPROC_DIR is unset; prefork child processes will not be exported")
+    start_http_server(port, registry=metrics_registry(broker_url))
+    logger.info(f"[Metrics] Worker metrics on :{port}/metrics")
+
+
+def mark_process_dead(pid):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -6,6 +6,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 from xgboost import XGBRegressor
 import joblib
+import json
 import pathlib
 
 load_dotenv()
@@ -22,19 +23,37 @@ def load_growing_season():
                (soil_snapshot->>'ph')::float as ph,
                (weather_aggregates->>'total_rainfall_mm')::float as total_rainfall,
                (weather_aggregates->>'gdd')::float as gdd,
-               (rs_aggregates->>'mean_ndvi')::float as mean_ndvi
+               (rs_aggregates->>'mean_ndvi')::float as mean_ndvi,
+               (fertilizer_history->>'n_kg_ha')::float as fert_n,
+               (fertilizer_history->>'p_kg_ha')::float as fert_p,
+               (fertilizer_history->>'k_kg_ha')::float as fert_k
         FROM growing_season
     """)
     df = pd.read_sql(q, engine)
     df = df.dropna(subset=['final_yield_kg_ha'])
     return df
 
+NPK_COLUMNS = ['fert_n', 'fert_p', 'fert_k']
+
 def featurize(df):
-    X = df[['soil_n','soil_p','soil_k','ph','total_rainfall','gdd','mean_ndvi']].fillna(0)
+    # Column order is part of the model contract; yield_model.py scores candidates in this order
+    X = df[['soil_n','soil_p','soil_k','ph','total_rainfall','gdd','mean_ndvi','fert_n','fert_p','fert_k']].fillna(0)
     X = pd.concat([X, pd.get_dummies(df['crop'], prefix='crop')], axis=1)
     y = df['final_yield_kg_ha']
     return X, y
 
+def feature_schema(X):
+    """Contents of <model>.features.json: column order plus the training spread of applied NPK.
+
+    yield_model.py only lets the optimizer search NPK with the model when every fert_* column
+    varied; growing_season.fertilizer_history must hold n_kg_ha/p_kg_ha/k_kg_ha for that.
+    """
+    npk_std = {c: float(X[c].std(ddof=0)) for c in NPK_COLUMNS}
+    if not all(v > 0 for v in npk_std.values()):
+        print(f"Warning: applied NPK is constant in the training data ({npk_std}); "
+              "the model will not be used for NPK optimization.")
+    return {"feature_columns": list(X.columns), "npk_std": npk_std}
+
 def train_and_save(X, y):
     if X.shape[0] < 10:
         print(f"Not enough rows to train a reliable model (found {X.shape[0]}). Add more data.")
@@ -47,7 +66,11 @@ def train_and_save(X, y):
     print(f"Test RMSE: {rmse:.2f}")
     models_dir = pathlib.Path("models")
     models_dir.mkdir(exist_ok=True)
-    joblib.dump(model, models_dir / "xgb_baseline.joblib")
+    (models_dir / "xgb_baseline.features.json").write_text(json.dumps(feature_schema(X)))
+    # Write then rename so workers hot-reloading the model never see a half-written file
+    tmp_path = models_dir / "xgb_baseline.joblib.tmp"
+    joblib.dump(model, tmp_path)
+    tmp_path.replace(models_dir / "xgb_baseline.joblib")
     print("Saved model to models/xgb_baseline.joblib")
 
 def main():
@@ -0,0 +1,168 @@
+"""Yield model training from the feature snapshot with parallel k-fold CV over a hyperparameter grid.
+
+Refreshes the snapshot (only seasons created since the last run are read from PostgreSQL), trains
+from the memory-mapped Parquet files, scores every (params, fold) pair on a process pool, refits the
+best parameters on all rows and writes a versioned artifact:
+
+    models/xgb_baseline-<version>.joblib          the model
+    models/xgb_baseline-<version>.features.json   feature column order (see yield_model.py)
+    models/xgb_baseline-<version>.report.json     CV scores, chosen params and stage timings
+
+With --promote (default) the artifact is also copied to models/xgb_baseline.joblib, which workers
+hot-reload.
+
+    python ml/train_pipeline.py [--folds 5] [--grid grid.json] [--workers N] [--no-refresh]
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import itertools
+import pathlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import joblib
+from sklearn.model_selection import KFold
+from xgboost import XGBRegressor
+from feature_snapshot import SNAPSHOT_DIR, load_snapshot, read_manifest, update_snapshot
+from train_baseline import feature_schema, featurize
+
+MODELS_DIR = pathlib.Path(os.getenv("MODELS_DIR", "models"))
+MODEL_NAME = "xgb_baseline"
+DEFAULT_GRID = {"max_depth": [3, 5, 7], "n_estimators": [100, 300], "learning_rate": [0.05, 0.1]}
+
+# Per-process training matrices, memory-mapped from the .npy files written by the parent
+_X = None
+_y = None
+
+
+def _init_worker(x_path, y_path):
+    global _X, _y
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path, mmap_mode="r")
+
+
+def _score_fold(task):
+    params, train_idx, test_idx = task
+    start = time.perf_counter()
+    model = XGBRegressor(random_state=42, verbosity=0, n_jobs=1, **params)
+    model.fit(_X[train_idx], _y[train_idx])
+    preds = model.predict(_X[test_idx])
+    rmse = float(np.sqrt(np.mean((preds - _y[test_idx]) ** 2)))
+    return json.dumps(params, sort_keys=True), rmse, time.perf_counter() - start
+
+
+def param_grid(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def cross_validate(X, y, grid, folds=5, workers=None):
+    """Mean/std RMSE per parameter set from k-fold CV, every (params, fold) fit on its own process.
+
+    X and y are written once as .npy files and memory-mapped by the workers instead of being pickled
+    into every task.
+    """
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(X))
+    params_list = param_grid(grid)
+    tasks = [(params, train_idx, test_idx) for params in params_list for train_idx, test_idx in splits]
+    scores, fit_seconds = {}, 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        x_path, y_path = os.path.join(tmp, "X.npy"), os.path.join(tmp, "y.npy")
+        np.save(x_path, np.ascontiguousarray(X, dtype=np.float32))
+        np.save(y_path, np.ascontiguousarray(y, dtype=np.float32))
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(x_path, y_path)) as pool:
+            for key, rmse, seconds in pool.map(_score_fold, tasks):
+                scores.setdefault(key, []).append(rmse)
+                fit_seconds += seconds
+    results = [{"params": json.loads(k), "rmse_mean": float(np.mean(v)), "rmse_std": float(np.std(v))} for k, v in scores.items()]
+    return sorted(results, key=lambda r: r["rmse_mean"]), fit_seconds
+
+
+def write_artifact(model, X, version, promote=True):
+    """Versioned model and feature schema; optionally promoted to the served model path."""
+    MODELS_DIR.mkdir(exist_ok=True)
+    base = MODELS_DIR / f"{MODEL_NAME}-{version}"
+    model_path = base.with_suffix(".joblib")
+    schema = json.dumps(dict(feature_schema(X), version=version))
+    base.with_suffix(".features.json").write_text(schema)
+    joblib.dump(model, model_path)
+    if promote:
+        # Schema first, then an atomic rename of the model, so a hot reload never pairs the wrong files
+        (MODELS_DIR / f"{MODEL_NAME}.features.json").write_text(schema)
+        tmp_path = MODELS_DIR / f"{MODEL_NAME}.joblib.tmp"
+        shutil.copyfile(model_path, tmp_path)
+        tmp_path.replace(MODELS_DIR / f"{MODEL_NAME}.joblib")
+    return model_path
+
+
+def run(snapshot_dir=None, grid=None, folds=5, workers=None, refresh=True, min_year=None, promote=True):
+    timings = {}
+    start = time.perf_counter()
+    new_rows = update_snapshot(snapshot_dir) if refresh else 0
+    timings["snapshot_refresh"] = time.perf_counter() - start
+
+    t = time.perf_counter()
+    df = load_snapshot(snapshot_dir, min_year=min_year)
+    df = df.dropna(subset=['final_yield_kg_ha'])
+    timings["load_snapshot"] = time.perf_counter() - t
+    if df.shape[0] < max(10, folds):
+        print(f"Not enough rows to train a reliable model (found {df.shape[0]}). Add more data.")
+        return None
+
+    t = time.perf_counter()
+    X, y = featurize(df)
+    X = X.astype(np.float32)
+    timings["featurize"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    cv_results, fit_seconds = cross_validate(X.to_numpy(), y.to_numpy(dtype=np.float32), grid or DEFAULT_GRID, folds, workers)
+    timings["cross_validation"] = time.perf_counter() - t
+    timings["cross_validation_cpu_fit"] = fit_seconds
+    best = cv_results[0]
+    print(f"Best CV RMSE {best['rmse_mean']:.2f} ± {best['rmse_std']:.2f} with {best['params']}")
+
+    t = time.perf_counter()
+    model = XGBRegressor(random_state=42, verbosity=0, n_jobs=workers or os.cpu_count(), **best["params"])
+    model.fit(X, y)
+    timings["refit"] = time.perf_counter() - t
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    report = {
+        "version": version, "rows": int(df.shape[0]), "new_snapshot_rows": new_rows,
+        "snapshot_watermark": read_manifest(snapshot_dir or SNAPSHOT_DIR)["watermark"],
+        "folds": folds, "workers": workers or os.cpu_count(), "best": best, "cv_results": cv_results,
+    }
+    t = time.perf_counter()
+    path = write_artifact(model, X, version, promote)
+    timings["save"] = time.perf_counter() - t
+    timings["total"] = time.perf_counter() - start
+    report.update(artifact=str(path), promoted=promote, timings_s={k: round(v, 3) for k, v in timings.items()})
+    path.with_suffix(".report.json").write_text(json.dumps(report, indent=2))
+    print("Timings (s): " + ", ".join(f"{k}={v:.2f}" for k, v in timings.items()))
+    print(f"Saved model to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the yield model from the feature snapshot.")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--grid", type=pathlib.Path, help="JSON object of XGBRegressor param -> list of values")
+    parser.add_argument("--workers", type=int, help="processes for CV (default: all cores)")
+    parser.add_argument("--min-year", type=int, help="only train on seasons from this year on")
+    parser.add_argument("--refresh", action=argparse.BooleanOptionalAction, default=True,
+                        help="pull new seasons into the snapshot first")
+    parser.add_argument("--promote", action=argparse.BooleanOptionalAction, default=True,
+                        help="also install the artifact as the served models/xgb_baseline.joblib")
+    args = parser.parse_args()
+    grid = json.loads(args.grid.read_text()) if args.grid else None
+    run(args.snapshot_dir, grid, args.folds, args.workers, args.refresh, args.min_year, args.promote)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,305 @@
-﻿# ... (Full optimizer.py content from previous correct version) ...
-import numpy as np; import pandas as pd; from scipy.optimize import minimize, Bounds, LinearConstraint; import os; import logging
-logging.basicConfig(level=logging.INFO); logger = logging.getLogger(__name__)
-def get_float_env(var_name, default_value): value_str = os.getenv(var_name); if value_str is None or value_str.strip() == "": return default_value; try: return float(value_str); except ValueError: logger.warning(f"Env var '{var_name}' invalid ('{value_str}'), using default: {default_value}"); return default_value
-CROP_PRICE_PER_KG = get_float_env('CROP_PRICE_PER_KG_INR', 20.0); COST_PER_KG_N = get_float_env('COST_PER_KG_N_INR', 40.0); COST_PER_KG_P = get_float_env('COST_PER_KG_P_INR', 80.0); COST_PER_KG_K = get_float_env('COST_PER_KG_K_INR', 30.0)
-def mock_yield_model(n, p, k, base_features_dict): soil_n = base_features_dict.get('soil_n', 25.0); total_rainfall = base_features_dict.get('total_rainfall', 500.0); gdd = base_features_dict.get('gdd', 1500.0); base_yield_potential = 100.0 + (soil_n * 0.2) + (total_rainfall * 0.05) + (gdd * 0.01); logger.debug(f"Base yield potential: {base_yield_potential:.1f}"); yield_n = 1.5 * n - 0.005 * n**2; yield_p = 0.8 * p; yield_k = 0.5 * k; total_yield = base_yield_potential + yield_n + yield_p + yield_k; return max(0, total_yield)
+import numpy as np
+import pandas as pd
+import os
+import logging
+from yield_model import get_yield_model
+from metrics import record_optimizer_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_float_env(var_name, default_value):
+    value_str = os.getenv(var_name)
+    if value_str is None or value_str.strip() == "":
+        return default_value
+    try:
+        return float(value_str)
+    except ValueError:
+        logger.warning(f"Env var '{var_name}' invalid ('{value_str}'), using default: {default_value}")
+        return default_value
+
+
+CROP_PRICE_PER_KG = get_float_env('CROP_PRICE_PER_KG_INR', 20.0)
+COST_PER_KG_N = get_float_env('COST_PER_KG_N_INR', 40.0)
+COST_PER_KG_P = get_float_env('COST_PER_KG_P_INR', 80.0)
+COST_PER_KG_K = get_float_env('COST_PER_KG_K_INR', 30.0)
+
+# Safety-first objective: maximise the 5th-percentile profit under a normal yield distribution
+Z_5TH_PERCENTILE = 1.645
+BASE_UNCERTAINTY = 0.10
+N_RISK_PER_KG = 0.10 / 150.0
+NPK_LOWER_BOUNDS = np.array([0.0, 0.0, 0.0])
+NPK_UPPER_BOUNDS = np.array([250.0, 150.0, 150.0])
+OPTIMIZER_FEATURES = ['soil_n', 'total_rainfall', 'gdd', 'soil_p', 'soil_k', 'ph']
+FEATURE_DEFAULTS = {'soil_n': 25.0, 'total_rainfall': 500.0, 'gdd': 1500.0}
+
+
+def mock_yield_model(n, p, k, base_features_dict):
+    soil_n = base_features_dict.get('soil_n', 25.0)
+    total_rainfall = base_features_dict.get('total_rainfall', 500.0)
+    gdd = base_features_dict.get('gdd', 1500.0)
+    base_yield_potential = 100.0 + (soil_n * 0.2) + (total_rainfall * 0.05) + (gdd * 0.01)
+    logger.debug(f"Base yield potential: {base_yield_potential:.1f}")
+    yield_n = 1.5 * n - 0.005 * n**2
+    yield_p = 0.8 * p
+    yield_k = 0.5 * k
+    total_yield = base_yield_potential + yield_n + yield_p + yield_k
+    return max(0, total_yield)
+
+
+def base_yield_potential_batch(features):
+    """Vectorized counterpart of the feature part of `mock_yield_model`, one value per row."""
+    df = pd.DataFrame(features)
+    cols = {}
+    for name, default in FEATURE_DEFAULTS.items():
+        if name in df.columns:
+            cols[name] = pd.to_numeric(df[name], errors='coerce').fillna(default).to_numpy(dtype=float)
+        else:
+            cols[name] = np.full(len(df), default)
+    return 100.0 + cols['soil_n'] * 0.2 + cols['total_rainfall'] * 0.05 + cols['gdd'] * 0.01
+
+
+def mock_yield_model_batch(npk, base_potential):
+    """Unclipped mock yield and its gradient w.r.t. (N, P, K) for an (M, 3) array of candidates."""
+    n, p, k = npk[:, 0], npk[:, 1], npk[:, 2]
+    mean_yield = base_potential + 1.5 * n - 0.005 * n**2 + 0.8 * p + 0.5 * k
+    grad = np.stack([1.5 - 0.01 * n, np.full_like(n, 0.8), np.full_like(n, 0.5)], axis=1)
+    return mean_yield, grad
+
+
+def yield_std_batch(mean_yield, n):
+    return np.where(mean_yield > 0, mean_yield * (BASE_UNCERTAINTY + n * N_RISK_PER_KG), 0.0)
+
+
+def safety_first_profit_batch(npk, base_potential, crop_price, costs):
+    """5th-percentile profit and its analytic gradient for every row of `npk`."""
+    mean_yield, mean_grad = mock_yield_model_batch(npk, base_potential)
+    n = npk[:, 0]
+    risk_factor = 1.0 - Z_5TH_PERCENTILE * (BASE_UNCERTAINTY + n * N_RISK_PER_KG)
+    cost = npk @ costs
+    positive = mean_yield > 0
+    profit = np.where(positive, crop_price * mean_yield * risk_factor, 0.0) - cost
+    yield_grad = mean_grad * risk_factor[:, None]
+    yield_grad[:, 0] -= mean_yield * Z_5TH_PERCENTILE * N_RISK_PER_KG
+    grad = np.where(positive[:, None], crop_price * yield_grad, 0.0) - costs
+    return profit, grad
+
+
+def project_onto_budget(npk, budgets, costs, lower=NPK_LOWER_BOUNDS, upper=NPK_UPPER_BOUNDS, n_bisect=60):
+    """Euclidean projection of each row onto {lower <= x <= upper, costs . x <= budget}."""
+    clipped = np.clip(npk, lower, upper)
+    over = clipped @ costs > budgets
+    if not over.any():
+        return clipped
+    y, b = npk[over], budgets[over]
+    lam_lo = np.zeros(len(b))
+    lam_hi = np.max(np.maximum(y - lower, 0.0) / np.where(costs > 0, costs, np.inf), axis=1) + 1.0
+    for _ in range(n_bisect):
+        lam = 0.5 * (lam_lo + lam_hi)
+        spend = np.clip(y - lam[:, None] * costs, lower, upper) @ costs
+        too_much = spend > b
+        lam_lo = np.where(too_much, lam, lam_lo)
+        lam_hi = np.where(too_much, lam_hi, lam)
+    clipped[over] = np.clip(y - lam_hi[:, None] * costs, lower, upper)
+    return clipped
+
+
+def initial_guess_batch(budgets, costs, upper=NPK_UPPER_BOUNDS):
+    shares = np.array([0.4, 0.3, 0.3])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        guess = np.where(costs > 0, budgets[:, None] * shares / costs, 0.0)
+    guess = np.maximum(0.1, np.minimum(upper, guess))
+    initial_cost = guess @ costs
+    scale = np.where(initial_cost > budgets, budgets / np.where(initial_cost > 0, initial_cost, 1.0) * 0.95, 1.0)
+    return guess * scale[:, None]
+
+
+def optimize_npk_batch(budgets, features, crop_price=None, costs=None, maxiter=500, xtol=1e-6, ftol=1e-9):
+    """Safety-first NPK optimisation for many fields at once.
+
+    `budgets` is a sequence of per-field budgets and `features` anything `pd.DataFrame` accepts
+    (DataFrame, dict of arrays, list of feature dicts) with one row per budget. Every field is
+    solved by vectorized projected-gradient ascent with an Armijo backtracking line search on the
+    same objective, bounds and budget constraint as the scalar optimizer.
+
+    Returns a DataFrame with N, P, K, yield_mean_at_optimum, yield_std_dev_at_optimum,
+    optimizer_status, success, nit and nfev columns, in the order of the input rows.
+    """
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=float))
+    base_potential = base_yield_potential_batch(features)
+    if len(base_potential) != len(budgets):
+        raise ValueError(f"Got {len(budgets)} budgets but {len(base_potential)} feature rows")
+    crop_price = CROP_PRICE_PER_KG if crop_price is None else float(crop_price)
+    costs = np.array([COST_PER_KG_N, COST_PER_KG_P, COST_PER_KG_K] if costs is None else costs, dtype=float)
+    logger.info(f"[Optimizer] Batch of {len(budgets)}: costs N:{costs[0]}, P:{costs[1]}, K:{costs[2]}, Price:{crop_price}")
+
+    # Work in spend space (INR per nutrient) so the budget constraint is isotropic and the
+    # ascent does not zigzag along it when nutrient prices differ by an order of magnitude.
+    scale = np.where(costs > 0, costs, 1.0)
+    weights = costs / scale
+    lower, upper = NPK_LOWER_BOUNDS * scale, NPK_UPPER_BOUNDS * scale
+
+    def profit_and_grad(spend, base):
+        f, g = safety_first_profit_batch(spend / scale, base, crop_price, costs)
+        return f, g / scale
+
+    feasible = budgets >= 0
+    y = project_onto_budget(initial_guess_batch(budgets, costs) * scale, np.maximum(budgets, 0.0), weights, lower, upper)
+    profit, grad = profit_and_grad(y, base_potential)
+    step = np.ones(len(budgets))
+    nit = np.zeros(len(budgets), dtype=int)
+    nfev = np.ones(len(budgets), dtype=int)
+    active = feasible.copy()
+
+    for _ in range(maxiter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        ya, fa, ga, sa = y[idx], profit[idx], grad[idx], step[idx] * 2.0
+        ba, bp = budgets[idx], base_potential[idx]
+        accepted = np.zeros(len(idx), dtype=bool)
+        y_new, f_new, g_new = ya.copy(), fa.copy(), ga.copy()
+        for _ in range(50):
+            todo = ~accepted
+            if not todo.any():
+                break
+            y_try = project_onto_budget(ya[todo] + sa[todo, None] * ga[todo], ba[todo], weights, lower, upper)
+            f_try, g_try = profit_and_grad(y_try, bp[todo])
+            ok = f_try >= fa[todo] + 1e-4 * np.sum(ga[todo] * (y_try - ya[todo]), axis=1)
+            rows = np.flatnonzero(todo)
+            nfev[idx[rows]] += 1
+            y_new[rows[ok]], f_new[rows[ok]], g_new[rows[ok]] = y_try[ok], f_try[ok], g_try[ok]
+            accepted[rows[ok]] = True
+            sa[rows[~ok]] *= 0.5
+        moved = np.max(np.abs(y_new - ya) / scale, axis=1)
+        gained = f_new - fa
+        y[idx], profit[idx], grad[idx], step[idx] = y_new, f_new, g_new, np.minimum(sa, 1e6)
+        nit[idx] += 1
+        done = ~accepted | (moved <= xtol) | (gained <= ftol * np.maximum(1.0, np.abs(fa)))
+        active[idx[done]] = False
+
+    x = y / scale
+    converged = feasible & ~active
+    x = np.maximum(x, 0.0)
+    mean_yield, _ = mock_yield_model_batch(x, base_potential)
+    mean_yield = np.maximum(mean_yield, 0.0)
+    std_dev = yield_std_batch(mean_yield, x[:, 0])
+    status = np.where(converged, "Optimization terminated successfully",
+                      np.where(feasible, "Iteration limit reached", "Budget must be non-negative"))
+    logger.info(f"[Optimizer] Batch done: {int(converged.sum())}/{len(budgets)} converged")
+    return pd.DataFrame({
+        "N": x[:, 0], "P": x[:, 1], "K": x[:, 2],
+        "yield_mean_at_optimum": mean_yield, "yield_std_dev_at_optimum": std_dev,
+        "optimizer_status": status, "success": converged, "nit": nit, "nfev": nfev,
+    })
+
+
+def _best_candidate_per_field(field_idx, profit, n_fields):
+    order = np.lexsort((-profit, field_idx))
+    fields, first = np.unique(field_idx[order], return_index=True)
+    best = np.full(n_fields, -1)
+    best[fields] = order[first]
+    return best
+
+
+def optimize_npk_grid_batch(budgets, predict_yield, crop_price=None, costs=None, steps=(10.0, 10.0, 10.0), refine_points=11):
+    """Safety-first NPK optimisation by batched grid search over a yield model.
+
+    `predict_yield(npk, field_idx)` must return the mean yield for every candidate row of the
+    (M, 3) `npk` array belonging to field `field_idx[j]`; it is called once for a coarse grid and
+    once for a finer grid around each field's best coarse point, so a model is queried with two
+    large batches instead of thousands of single rows. Uncertainty and profit follow the same
+    safety-first formula as `optimize_npk_batch`; returns a DataFrame with the same columns.
+    """
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=float))
+    n_fields = len(budgets)
+    crop_price = CROP_PRICE_PER_KG if crop_price is None else float(crop_price)
+    costs = np.array([COST_PER_KG_N, COST_PER_KG_P, COST_PER_KG_K] if costs is None else costs, dtype=float)
+    steps = np.asarray(steps, dtype=float)
+    axes = [np.arange(lo, hi + 1e-9, st) for lo, hi, st in zip(NPK_LOWER_BOUNDS, NPK_UPPER_BOUNDS, steps)]
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    offsets = np.linspace(-1.0, 1.0, refine_points)
+    local = np.stack(np.meshgrid(offsets, offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 3) * steps
+
+    def score(npk, field_idx):
+        mean_yield = np.maximum(np.asarray(predict_yield(npk, field_idx), dtype=float), 0.0)
+        std_dev = yield_std_batch(mean_yield, npk[:, 0])
+        profit = crop_price * (mean_yield - Z_5TH_PERCENTILE * std_dev) - npk @ costs
+        return profit, mean_yield, std_dev
+
+    grid_cost = grid @ costs
+    field_idx, cand_idx = np.nonzero(grid_cost[None, :] <= budgets[:, None])
+    npk = grid[cand_idx]
+    profit, _, _ = score(npk, field_idx)
+    best = _best_candidate_per_field(field_idx, profit, n_fields)
+    centre = np.zeros((n_fields, 3))
+    centre[best >= 0] = npk[best[best >= 0]]
+    nfev = np.bincount(field_idx, minlength=n_fields)
+
+    refined = np.clip(centre[:, None, :] + local[None, :, :], NPK_LOWER_BOUNDS, NPK_UPPER_BOUNDS).reshape(-1, 3)
+    refined_field = np.repeat(np.arange(n_fields), len(local))
+    keep = refined @ costs <= budgets[refined_field] + 1e-9
+    npk, field_idx = refined[keep], refined_field[keep]
+    profit, mean_yield, std_dev = score(npk, field_idx)
+    best = _best_candidate_per_field(field_idx, profit, n_fields)
+    nfev += np.bincount(field_idx, minlength=n_fields)
+
+    found = best >= 0
+    x = np.zeros((n_fields, 3))
+    x[found] = npk[best[found]]
+    mean_out, std_out = np.zeros(n_fields), np.zeros(n_fields)
+    mean_out[found], std_out[found] = mean_yield[best[found]], std_dev[best[found]]
+    logger.info(f"[Optimizer] Grid batch of {n_fields}: {int(nfev.sum())} candidates scored")
+    return pd.DataFrame({
+        "N": x[:, 0], "P": x[:, 1], "K": x[:, 2],
+        "yield_mean_at_optimum": mean_out, "yield_std_dev_at_optimum": std_out,
+        "optimizer_status": np.where(found, "Grid search completed", "No feasible candidate within budget"),
+        "success": found, "nit": np.full(n_fields, 2), "nfev": nfev,
+    })
+
+
+def optimize_fields(budgets, feature_dicts, crop):
+    """Optimize NPK for several fields together with the trained model if one is available.
+
+    Without an NPK-aware model the mock yield model is used; both paths are counted in metrics.
+    """
+    model = get_yield_model()
+    if model is not None and model.supports_npk:
+        base = model.base_matrix(feature_dicts, [crop] * len(feature_dicts))
+        df = optimize_npk_grid_batch(budgets, lambda npk, field_idx: model.predict_candidates(base, npk, field_idx))
+        record_optimizer_results("model", df)
+        return df
+    df = optimize_npk_batch(budgets, [{k: v for k, v in X.items() if k in OPTIMIZER_FEATURES} for X in feature_dicts])
+    record_optimizer_results("fallback", df)
+    return df
+
+
+def result_from_batch_row(row) -> dict:
+    """Rounded scalar-style result dict for one row (Series or dict) of `optimize_npk_batch` output."""
+    return {
+        "N": round(float(row["N"]), 2), "P": round(float(row["P"]), 2), "K": round(float(row["K"]), 2),
+        "yield_mean_at_optimum": round(float(row["yield_mean_at_optimum"]), 2),
+        "yield_std_dev_at_optimum": round(float(row["yield_std_dev_at_optimum"]), 2),
+        "optimizer_status": row["optimizer_status"] if row["success"] else f"Failed: {row['optimizer_status']}",
+    }
+
+
+def optimize_field(budget: float, features: dict, crop: str) -> dict:
+    """`optimize_fields` for one field as a rounded result dict; picklable, for process pools."""
+    return result_from_batch_row(optimize_fields([budget], [features], crop).iloc[0])
+
+
+def warm_optimizer_process():
+    """Process pool initializer: load the yield model before the first `optimize_field` call."""
+    get_yield_model()
+
+
 def optimize_npk_safety_first(budget: float, base_features_dict: dict) -> dict:
-    logger.info(f"[Optimizer] Starting: budget={budget}, features={list(base_features_dict.keys())}"); logger.info(f"[Optimizer] Costs - N:{COST_PER_KG_N}, P:{COST_PER_KG_P}, K:{COST_PER_KG_K}, Price:{CROP_PRICE_PER_KG}")
-    def objective_function(npk):
-        n, p, k = npk; cost = n * COST_PER_KG_N + p * COST_PER_KG_P + k * COST_PER_KG_K; mean_yield = mock_yield_model(n, p, k, base_features_dict); std_dev = 0
-        if mean_yield > 0: base_uncert = 0.10; n_risk = (n / 150.0) * 0.10; std_dev = mean_yield * (base_uncert + n_risk)
-        else: mean_yield = 0
-        yield_5th = mean_yield - 1.645 * std_dev; profit_5th = (yield_5th * CROP_PRICE_PER_KG) - cost; return -profit_5th
-    budget_constraint = LinearConstraint([[COST_PER_KG_N, COST_PER_KG_P, COST_PER_KG_K]], [0], [budget]); bounds = Bounds(lb=[0, 0, 0], ub=[250, 150, 150])
-    init_n = max(0.1, min(bounds.ub[0], (budget*0.4)/COST_PER_KG_N if COST_PER_KG_N > 0 else 0)); init_p = max(0.1, min(bounds.ub[1], (budget*0.3)/COST_PER_KG_P if COST_PER_KG_P > 0 else 0)); init_k = max(0.1, min(bounds.ub[2], (budget*0.3)/COST_PER_KG_K if COST_PER_KG_K > 0 else 0)); initial_cost = init_n*COST_PER_KG_N + init_p*COST_PER_KG_P + init_k*COST_PER_KG_K
-    if initial_cost > budget: scale = budget / initial_cost * 0.95; initial_guess = [init_n*scale, init_p*scale, init_k*scale]
-    else: initial_guess = [init_n, init_p, init_k]
-    logger.info(f"[Optimizer] Initial Guess: {initial_guess}"); result = minimize(objective_function, initial_guess, method='SLSQP', bounds=bounds, constraints=[budget_constraint], options={'disp': False, 'maxiter': 100, 'ftol': 1e-7})
-    if result.success:
-        opt_n, opt_p, opt_k = result.x; opt_n=max(0, opt_n); opt_p=max(0, opt_p); opt_k=max(0, opt_k); logger.info(f"[Optimizer] Success! NPK: ({opt_n:.1f}, {opt_p:.1f}, {opt_k:.1f})"); final_mean = mock_yield_model(opt_n, opt_p, opt_k, base_features_dict); final_std = 0
-        if final_mean > 0: base_uncert = 0.10; n_risk = (opt_n / 150.0) * 0.10; final_std = final_mean * (base_uncert + n_risk)
-        return {"N": round(opt_n, 2), "P": round(opt_p, 2), "K": round(opt_k, 2), "yield_mean_at_optimum": round(max(0, final_mean), 2), "yield_std_dev_at_optimum": round(max(0, final_std), 2), "optimizer_status": result.message}
-    else: logger.warning(f"[Optimizer] Failed! {result.message}. Fallback..."); result_zero = minimize(objective_function, [0,0,0], method='SLSQP', bounds=bounds, constraints=[budget_constraint], options={'disp': False, 'maxiter': 50, 'ftol': 1e-7})
-        if result_zero.success: opt_n, opt_p, opt_k = result_zero.x; opt_n=max(0, opt_n); opt_p=max(0, opt_p); opt_k=max(0, opt_k); logger.info(f"[Optimizer] Fallback success! NPK: ({opt_n:.1f}, {opt_p:.1f}, {opt_k:.1f})"); final_mean = mock_yield_model(opt_n, opt_p, opt_k, base_features_dict); final_std = 0; if final_mean > 0: base_uncert = 0.10; n_risk = (opt_n / 150.0) * 0.10; final_std = final_mean * (base_uncert + n_risk); return {"N": round(opt_n, 2), "P": round(opt_p, 2), "K": round(opt_k, 2), "yield_mean_at_optimum": round(max(0, final_mean), 2), "yield_std_dev_at_optimum": round(max(0, final_std), 2), "optimizer_status": f"Fallback success: {result_zero.message}"}
-        else: logger.error(f"[Optimizer] Fallback failed! {result_zero.message}"); return {"N": 0, "P": 0, "K": 0, "yield_mean_at_optimum": 0, "yield_std_dev_at_optimum": 0, "optimizer_status": f"Failed: {result.message}; Fallback failed: {result_zero.message}"}
+    logger.info(f"[Optimizer] Starting: budget={budget}, features={list(base_features_dict.keys())}")
+    row = optimize_npk_batch([budget], [base_features_dict]).iloc[0]
+    if row["success"]:
+        logger.info(f"[Optimizer] Success! NPK: ({row['N']:.1f}, {row['P']:.1f}, {row['K']:.1f})")
+    else:
+        logger.warning(f"[Optimizer] Failed! {row['optimizer_status']}")
+    return result_from_batch_row(row)
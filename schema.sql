@@ -113,3 +113,161 @@ CREATE TABLE IF NOT EXISTS recommendation (
   status TEXT DEFAULT 'completed'
 );
 CREATE INDEX IF NOT EXISTS idx_recommendation_field ON recommendation(field_id);
+CREATE INDEX IF NOT EXISTS idx_recommendation_batch ON recommendation ((recommended_json->>'batch_id'));
+
+-- Latest-season features per field (materialized from growing_season, kept current by triggers)
+CREATE INDEX IF NOT EXISTS idx_growing_season_field_year ON growing_season(field_id, season_year DESC);
+
+CREATE TABLE IF NOT EXISTS field_latest_features (
+  field_id UUID PRIMARY KEY REFERENCES field(id) ON DELETE CASCADE,
+  growing_season_id UUID,
+  season_year INTEGER,
+  crop TEXT,
+  planting_date DATE,
+  harvest_date DATE,
+  soil_n DOUBLE PRECISION,
+  soil_p DOUBLE PRECISION,
+  soil_k DOUBLE PRECISION,
+  ph DOUBLE PRECISION,
+  organic_carbon_pct DOUBLE PRECISION,
+  total_rainfall_mm DOUBLE PRECISION,
+  gdd DOUBLE PRECISION,
+  mean_ndvi DOUBLE PRECISION,
+  refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_field_latest_features_field_year ON field_latest_features(field_id, season_year);
+
+-- Statement-level so bulk INSERT/COPY upserts once per statement, not once per row. Inserts can
+-- only raise a field's latest season, so only newer (or same-year, later) rows replace the current one
+CREATE OR REPLACE FUNCTION refresh_field_latest_features() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO field_latest_features AS flf
+    (field_id, growing_season_id, season_year, crop, planting_date, harvest_date,
+     soil_n, soil_p, soil_k, ph, organic_carbon_pct, total_rainfall_mm, gdd, mean_ndvi, refreshed_at)
+  SELECT DISTINCT ON (n.field_id)
+         n.field_id, n.id, n.season_year, n.crop, n.planting_date, n.harvest_date,
+         (n.soil_snapshot->>'n_kg_ha')::float,
+         (n.soil_snapshot->>'p_olsen_mg_kg')::float,
+         (n.soil_snapshot->>'k_mg_kg')::float,
+         (n.soil_snapshot->>'ph')::float,
+         (n.soil_snapshot->>'organic_carbon_pct')::float,
+         (n.weather_aggregates->>'total_rainfall_mm')::float,
+         (n.weather_aggregates->>'gdd')::float,
+         (n.rs_aggregates->>'mean_ndvi')::float,
+         now()
+  FROM new_rows n
+  WHERE n.field_id IS NOT NULL
+  ORDER BY n.field_id, n.season_year DESC NULLS LAST, n.created_at DESC
+  ON CONFLICT (field_id) DO UPDATE SET
+    growing_season_id = EXCLUDED.growing_season_id,
+    season_year = EXCLUDED.season_year,
+    crop = EXCLUDED.crop,
+    planting_date = EXCLUDED.planting_date,
+    harvest_date = EXCLUDED.harvest_date,
+    soil_n = EXCLUDED.soil_n,
+    soil_p = EXCLUDED.soil_p,
+    soil_k = EXCLUDED.soil_k,
+    ph = EXCLUDED.ph,
+    organic_carbon_pct = EXCLUDED.organic_carbon_pct,
+    total_rainfall_mm = EXCLUDED.total_rainfall_mm,
+    gdd = EXCLUDED.gdd,
+    mean_ndvi = EXCLUDED.mean_ndvi,
+    refreshed_at = EXCLUDED.refreshed_at
+  WHERE flf.season_year IS NULL
+     OR EXCLUDED.season_year >= flf.season_year
+     OR flf.growing_season_id = EXCLUDED.growing_season_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Updates and deletes can lower a field's latest season (a deleted row, a season_year corrected
+-- downward, a row moved to another field), so the fields they touch are recomputed from growing_season
+CREATE OR REPLACE FUNCTION recompute_field_latest_features(field_ids UUID[]) RETURNS void AS $$
+  DELETE FROM field_latest_features flf
+  WHERE flf.field_id = ANY(field_ids)
+    AND NOT EXISTS (SELECT 1 FROM growing_season gs WHERE gs.field_id = flf.field_id);
+
+  INSERT INTO field_latest_features AS flf
+    (field_id, growing_season_id, season_year, crop, planting_date, harvest_date,
+     soil_n, soil_p, soil_k, ph, organic_carbon_pct, total_rainfall_mm, gdd, mean_ndvi, refreshed_at)
+  SELECT DISTINCT ON (gs.field_id)
+         gs.field_id, gs.id, gs.season_year, gs.crop, gs.planting_date, gs.harvest_date,
+         (gs.soil_snapshot->>'n_kg_ha')::float,
+         (gs.soil_snapshot->>'p_olsen_mg_kg')::float,
+         (gs.soil_snapshot->>'k_mg_kg')::float,
+         (gs.soil_snapshot->>'ph')::float,
+         (gs.soil_snapshot->>'organic_carbon_pct')::float,
+         (gs.weather_aggregates->>'total_rainfall_mm')::float,
+         (gs.weather_aggregates->>'gdd')::float,
+         (gs.rs_aggregates->>'mean_ndvi')::float,
+         now()
+  FROM growing_season gs
+  WHERE gs.field_id = ANY(field_ids)
+  ORDER BY gs.field_id, gs.season_year DESC NULLS LAST, gs.created_at DESC
+  ON CONFLICT (field_id) DO UPDATE SET
+    growing_season_id = EXCLUDED.growing_season_id,
+    season_year = EXCLUDED.season_year,
+    crop = EXCLUDED.crop,
+    planting_date = EXCLUDED.planting_date,
+    harvest_date = EXCLUDED.harvest_date,
+    soil_n = EXCLUDED.soil_n,
+    soil_p = EXCLUDED.soil_p,
+    soil_k = EXCLUDED.soil_k,
+    ph = EXCLUDED.ph,
+    organic_carbon_pct = EXCLUDED.organic_carbon_pct,
+    total_rainfall_mm = EXCLUDED.total_rainfall_mm,
+    gdd = EXCLUDED.gdd,
+    mean_ndvi = EXCLUDED.mean_ndvi,
+    refreshed_at = EXCLUDED.refreshed_at;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION recompute_changed_field_latest_features() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    PERFORM recompute_field_latest_features(ARRAY(
+      SELECT field_id FROM old_rows WHERE field_id IS NOT NULL
+      UNION SELECT field_id FROM new_rows WHERE field_id IS NOT NULL));
+  ELSE
+    PERFORM recompute_field_latest_features(ARRAY(
+      SELECT DISTINCT field_id FROM old_rows WHERE field_id IS NOT NULL));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS growing_season_latest_features_ins ON growing_season;
+CREATE TRIGGER growing_season_latest_features_ins
+  AFTER INSERT ON growing_season
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION refresh_field_latest_features();
+
+DROP TRIGGER IF EXISTS growing_season_latest_features_upd ON growing_season;
+CREATE TRIGGER growing_season_latest_features_upd
+  AFTER UPDATE ON growing_season
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION recompute_changed_field_latest_features();
+
+DROP TRIGGER IF EXISTS growing_season_latest_features_del ON growing_season;
+CREATE TRIGGER growing_season_latest_features_del
+  AFTER DELETE ON growing_season
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION recompute_changed_field_latest_features();
+
+-- One-off backfill for databases that already hold growing_season rows
+INSERT INTO field_latest_features
+  (field_id, growing_season_id, season_year, crop, planting_date, harvest_date,
+   soil_n, soil_p, soil_k, ph, organic_carbon_pct, total_rainfall_mm, gdd, mean_ndvi)
+SELECT DISTINCT ON (gs.field_id)
+       gs.field_id, gs.id, gs.season_year, gs.crop, gs.planting_date, gs.harvest_date,
+       (gs.soil_snapshot->>'n_kg_ha')::float,
+       (gs.soil_snapshot->>'p_olsen_mg_kg')::float,
+       (gs.soil_snapshot->>'k_mg_kg')::float,
+       (gs.soil_snapshot->>'ph')::float,
+       (gs.soil_snapshot->>'organic_carbon_pct')::float,
+       (gs.weather_aggregates->>'total_rainfall_mm')::float,
+       (gs.weather_aggregates->>'gdd')::float,
+       (gs.rs_aggregates->>'mean_ndvi')::float
+FROM growing_season gs
+WHERE gs.field_id IS NOT NULL
+ORDER BY gs.field_id, gs.season_year DESC NULLS LAST, gs.created_at DESC
+ON CONFLICT (field_id) DO NOTHING;
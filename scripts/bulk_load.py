@@ -0,0 +1,227 @@
+"""Streaming bulk loader for field, growing_season, soil_sample and weather_record.
+
+Rows are streamed in fixed-size chunks and written with PostgreSQL COPY (CSV format), so memory
+stays bounded by the chunk size regardless of input size. Geometry columns are sent as EWKT and
+JSONB columns as JSON text. Example:
+
+    python scripts/bulk_load.py --fields scripts/sample_fields.csv \\
+        --growing-season scripts/sample_growing_season_aug.csv --truncate
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import time
+import uuid
+from collections import namedtuple
+from datetime import date, datetime
+
+import pandas as pd
+import psycopg2
+
+DEFAULT_CHUNK_ROWS = int(os.getenv("BULK_LOAD_CHUNK_ROWS", "50000"))
+FIELD_HALF_SIDE_DEG = 0.0008
+
+TABLE_COLUMNS = {
+    "field": ["id", "farm_id", "name", "area_ha", "geom", "centroid", "default_crop"],
+    "growing_season": ["id", "field_id", "season_year", "crop", "planting_date", "harvest_date", "previous_crop",
+                       "soil_snapshot", "weather_aggregates", "rs_aggregates", "fertilizer_history",
+                       "final_yield_kg_ha"],
+    "soil_sample": ["id", "field_id", "sample_date", "depth_cm", "n_kg_ha", "p_olsen_mg_kg", "k_mg_kg", "ph",
+                    "organic_carbon_pct", "ec", "cec", "texture", "lab_json"],
+    "weather_record": ["id", "date", "location", "tmin", "tmax", "rainfall_mm", "rh", "solar_rad", "raw_json"],
+}
+JSON_COLUMNS = {"soil_snapshot", "weather_aggregates", "rs_aggregates", "fertilizer_history", "lab_json", "raw_json"}
+
+LoadReport = namedtuple("LoadReport", ["table", "rows", "seconds"])
+
+
+def connect_db():
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST", "db"),
+        database=os.environ.get("DB_NAME", "fertdss"),
+        user=os.environ.get("DB_USER", "fert_user"),
+        password=os.environ.get("DB_PASSWORD", "fert_pass")
+    )
+
+
+def point_ewkt(lat, lon):
+    return f"SRID=4326;POINT({lon} {lat})"
+
+
+def square_polygon_ewkt(lat, lon, lat_half=FIELD_HALF_SIDE_DEG, lon_half=FIELD_HALF_SIDE_DEG):
+    ring = [(lon - lon_half, lat - lat_half), (lon + lon_half, lat - lat_half), (lon + lon_half, lat + lat_half),
+            (lon - lon_half, lat + lat_half), (lon - lon_half, lat - lat_half)]
+    return "SRID=4326;POLYGON((" + ",".join(f"{x} {y}" for x, y in ring) + "))"
+
+
+def _encode(value):
+    """Python value -> COPY CSV cell; None becomes an unquoted empty cell, i.e. NULL."""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _none_if_nan(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+
+
+def _float_or_none(value):
+    value = _none_if_nan(value)
+    return None if value is None else float(value)
+
+
+def report_line(report):
+    rate = report.rows / report.seconds if report.seconds > 0 else float("inf")
+    return f"{report.table}: {report.rows:,} rows in {report.seconds:.1f}s ({rate:,.0f} rows/s)"
+
+
+def copy_rows(conn, table, rows, chunk_rows=DEFAULT_CHUNK_ROWS, verbose=True):
+    """COPY an iterable of row dicts into `table`, one COPY statement and commit per chunk."""
+    columns = TABLE_COLUMNS[table]
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    rows = iter(rows)
+    total = 0
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                break
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            for r in chunk:
+                writer.writerow([_encode(r.get(c)) for c in columns])
+            buf.seek(0)
+            cur.copy_expert(sql, buf)
+            conn.commit()
+            total += len(chunk)
+            if verbose:
+                print(report_line(LoadReport(table, total, time.perf_counter() - start)), flush=True)
+    return LoadReport(table, total, time.perf_counter() - start)
+
+
+def _csv_records(path, chunksize):
+    for chunk in pd.read_csv(path, chunksize=chunksize, encoding="utf-8-sig"):
+        yield from chunk.to_dict(orient="records")
+
+
+def field_rows_from_csv(path, field_ids_by_name, chunksize=DEFAULT_CHUNK_ROWS):
+    """Rows for `field` from a name,lat,lon,area_ha[,default_crop] CSV; fills `field_ids_by_name`."""
+    for r in _csv_records(path, chunksize):
+        field_id = str(uuid.uuid4())
+        field_ids_by_name[r["name"]] = field_id
+        lat, lon = float(r["lat"]), float(r["lon"])
+        yield {
+            "id": field_id, "farm_id": _none_if_nan(r.get("farm_id")), "name": r["name"],
+            "area_ha": _float_or_none(r.get("area_ha")),
+            "geom": square_polygon_ewkt(lat, lon), "centroid": point_ewkt(lat, lon),
+            "default_crop": _none_if_nan(r.get("default_crop")),
+        }
+
+
+def growing_season_rows_from_csv(path, field_ids_by_name, chunksize=DEFAULT_CHUNK_ROWS):
+    """Rows for `growing_season` from the sample_growing_season*.csv layout.
+
+    Fields are matched by `field_name` through `field_ids_by_name`, or taken from a `field_id` column.
+    Optional fert_n/fert_p/fert_k columns (applied kg/ha) go to fertilizer_history as
+    n_kg_ha/p_kg_ha/k_kg_ha, the keys training reads; without them the model cannot learn an NPK response.
+    """
+    for r in _csv_records(path, chunksize):
+        if "field_name" in r:
+            field_id = field_ids_by_name.get(r["field_name"])
+            if not field_id:
+                print(f"⚠️ Skipping {r['field_name']} (not found in DB)")
+                continue
+        else:
+            field_id = r["field_id"]
+        rainfall = r.get("rainfall_mm", r.get("total_rainfall_mm"))
+        yield {
+            "id": str(uuid.uuid4()), "field_id": field_id, "season_year": int(r["season_year"]),
+            "crop": r["crop"], "planting_date": r["planting_date"], "harvest_date": r["harvest_date"],
+            "previous_crop": _none_if_nan(r.get("previous_crop")),
+            "soil_snapshot": {
+                "n_kg_ha": _float_or_none(r.get("soil_n")),
+                "p_olsen_mg_kg": _float_or_none(r.get("soil_p")),
+                "k_mg_kg": _float_or_none(r.get("soil_k")),
+                "ph": _float_or_none(r.get("ph")),
+            },
+            "weather_aggregates": {"total_rainfall_mm": _float_or_none(rainfall), "gdd": _float_or_none(r.get("gdd"))},
+            "rs_aggregates": {"mean_ndvi": _float_or_none(r.get("mean_ndvi"))},
+            "fertilizer_history": {
+                "n_kg_ha": _float_or_none(r.get("fert_n")),
+                "p_kg_ha": _float_or_none(r.get("fert_p")),
+                "k_kg_ha": _float_or_none(r.get("fert_k")),
+            },
+            "final_yield_kg_ha": _float_or_none(r.get("final_yield_kg_ha")),
+        }
+
+
+def table_rows_from_csv(path, table, chunksize=DEFAULT_CHUNK_ROWS):
+    """Rows for tables whose CSV columns already match the table (soil_sample, weather_record).
+
+    Missing ids are generated and a weather_record `location` is built from lat/lon columns.
+    """
+    columns = TABLE_COLUMNS[table]
+    for r in _csv_records(path, chunksize):
+        row = {c: _none_if_nan(r.get(c)) for c in columns}
+        row["id"] = row["id"] or str(uuid.uuid4())
+        if table == "weather_record" and row["location"] is None and "lat" in r and "lon" in r:
+            row["location"] = point_ewkt(float(r["lat"]), float(r["lon"]))
+        for c in JSON_COLUMNS.intersection(columns):
+            if isinstance(row[c], str):
+                row[c] = json.loads(row[c])
+        yield row
+
+
+def load_field_ids_by_name(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id::text, name FROM field;")
+        return {name: field_id for field_id, name in cur.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load CSV data with COPY.")
+    parser.add_argument("--fields")
+    parser.add_argument("--growing-season")
+    parser.add_argument("--soil-sample")
+    parser.add_argument("--weather-record")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--truncate", action="store_true", help="empty the target tables first")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    reports = []
+    if args.truncate:
+        targets = [t for t, p in [("field", args.fields), ("growing_season", args.growing_season),
+                                  ("soil_sample", args.soil_sample), ("weather_record", args.weather_record)] if p]
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE TABLE {', '.join(targets)} CASCADE;")
+        conn.commit()
+    field_ids_by_name = {}
+    if args.fields:
+        reports.append(copy_rows(conn, "field", field_rows_from_csv(args.fields, field_ids_by_name, args.chunk_rows), args.chunk_rows))
+    if args.growing_season:
+        if not field_ids_by_name:
+            field_ids_by_name = load_field_ids_by_name(conn)
+        reports.append(copy_rows(conn, "growing_season", growing_season_rows_from_csv(args.growing_season, field_ids_by_name, args.chunk_rows), args.chunk_rows))
+    if args.soil_sample:
+        reports.append(copy_rows(conn, "soil_sample", table_rows_from_csv(args.soil_sample, "soil_sample", args.chunk_rows), args.chunk_rows))
+    if args.weather_record:
+        reports.append(copy_rows(conn, "weather_record", table_rows_from_csv(args.weather_record, "weather_record", args.chunk_rows), args.chunk_rows))
+    conn.close()
+    for r in reports:
+        print("✅ " + report_line(r))
+
+
+if __name__ == "__main__":
+    main()
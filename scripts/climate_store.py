@@ -0,0 +1,334 @@
+"""Offline gridded climate store with prefix sums for constant-time season aggregates.
+
+Daily tmin, tmax and rainfall are filled for every grid cell of a study region, from weather_record
+or bulk archive downloads, and saved as memory-mapped NumPy arrays indexed by (cell, day) together
+with cumulative sums of rainfall, mean temperature, valid-day counts and GDD for each configured base
+temperature. A window total is then cum[cell, end + 1] - cum[cell, start], for one window or many; the
+valid-day counts tell callers when a window has gaps.
+
+    python scripts/climate_store.py build --bbox 17.5 20.5 72.5 75.5 --start 2015-01-01 --end 2024-12-31 \\
+        --source api --base-temps 8 10
+    python scripts/climate_store.py info
+"""
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+
+try:
+    from scripts.weather_cache import WEATHER_GRID_DEG, WEATHER_HTTP_POOL_SIZE, fetch_daily
+except ImportError:
+    from weather_cache import WEATHER_GRID_DEG, WEATHER_HTTP_POOL_SIZE, fetch_daily
+
+CLIMATE_STORE_PATH = os.getenv("CLIMATE_STORE_PATH", "cache/climate_store")
+CLIMATE_STORE_CHUNK_CELLS = int(os.getenv("CLIMATE_STORE_CHUNK_CELLS", "256"))
+# Share of a window's days that must have both temperature and rainfall for the store to answer it
+CLIMATE_STORE_MIN_VALID_FRAC = float(os.getenv("CLIMATE_STORE_MIN_VALID_FRAC", "1.0"))
+DEFAULT_BASE_TEMPS = [10.0]
+
+DAILY_ARRAYS = ["tmin", "tmax", "rain"]
+
+WEATHER_RECORD_QUERY = """
+    SELECT ST_Y(location) AS lat, ST_X(location) AS lon, date, tmin::float, tmax::float, rainfall_mm::float
+    FROM weather_record
+    WHERE date BETWEEN %(start)s AND %(end)s
+      AND location && ST_MakeEnvelope(%(lon_min)s, %(lat_min)s, %(lon_max)s, %(lat_max)s, 4326)
+"""
+
+
+def _gdd_name(base_temp):
+    return f"gdd_cum_{float(base_temp):g}"
+
+
+class ClimateGrid:
+    """Regular lat/lon grid over a bounding box plus a daily calendar; maps coordinates and dates to indices."""
+
+    def __init__(self, lat_min, lat_max, lon_min, lon_max, start_date, end_date, grid_deg=None):
+        self.grid_deg = float(grid_deg or WEATHER_GRID_DEG)
+        g = self.grid_deg
+        self.lat0, self.lon0 = round(lat_min / g) * g, round(lon_min / g) * g
+        self.n_lat = int(round(lat_max / g) - round(lat_min / g)) + 1
+        self.n_lon = int(round(lon_max / g) - round(lon_min / g)) + 1
+        self.start = np.datetime64(str(start_date)[:10], "D")
+        self.n_days = int((np.datetime64(str(end_date)[:10], "D") - self.start).astype(int)) + 1
+
+    @property
+    def n_cells(self):
+        return self.n_lat * self.n_lon
+
+    def meta(self):
+        return {"grid_deg": self.grid_deg, "lat0": self.lat0, "lon0": self.lon0, "n_lat": self.n_lat,
+                "n_lon": self.n_lon, "start_date": str(self.start), "n_days": self.n_days}
+
+    @classmethod
+    def from_meta(cls, meta):
+        grid = cls.__new__(cls)
+        grid.grid_deg, grid.lat0, grid.lon0 = meta["grid_deg"], meta["lat0"], meta["lon0"]
+        grid.n_lat, grid.n_lon, grid.n_days = meta["n_lat"], meta["n_lon"], meta["n_days"]
+        grid.start = np.datetime64(meta["start_date"], "D")
+        return grid
+
+    def cell_index(self, lats, lons):
+        """Cell index per coordinate (snapped like WeatherCache.snap); -1 outside the grid."""
+        g = self.grid_deg
+        # round(x / g) on the raw coordinate, exactly as snap() does, then offset by the grid origin
+        i = (np.round(np.asarray(lats, dtype=float) / g) - round(self.lat0 / g)).astype(np.int64)
+        j = (np.round(np.asarray(lons, dtype=float) / g) - round(self.lon0 / g)).astype(np.int64)
+        inside = (i >= 0) & (i < self.n_lat) & (j >= 0) & (j < self.n_lon)
+        return np.where(inside, i * self.n_lon + j, -1)
+
+    def cell_center(self, cell):
+        g = self.grid_deg
+        return (round((round(self.lat0 / g) + cell // self.n_lon) * g, 6),
+                round((round(self.lon0 / g) + cell % self.n_lon) * g, 6))
+
+    def day_index(self, dates):
+        """Day offset from the store start per date (ISO strings, dates or datetime64)."""
+        days = np.asarray(dates)
+        if days.dtype.kind != "M":
+            days = np.array([str(d)[:10] for d in days.ravel()], dtype="datetime64[D]").reshape(days.shape)
+        return (days.astype("datetime64[D]") - self.start).astype(np.int64)
+
+
+def _open_arrays(path, grid, mode):
+    return {name: np.lib.format.open_memmap(path / f"{name}.npy", mode=mode, dtype=np.float32,
+                                            shape=(grid.n_cells, grid.n_days) if mode == "w+" else None)
+            for name in DAILY_ARRAYS}
+
+
+def fill_from_weather_record(daily, grid, conn, chunk_rows=100000, verbose=True):
+    """Average weather_record rows into grid cells, streamed through a server-side cursor.
+
+    Sums and per-variable counts are accumulated in the memory-mapped daily arrays and a scratch
+    counts file, so memory stays bounded by `chunk_rows` whatever the region size.
+    """
+    g = grid.grid_deg
+    params = {"start": str(grid.start), "end": str(grid.start + grid.n_days - 1),
+              "lat_min": grid.lat0 - g / 2, "lon_min": grid.lon0 - g / 2,
+              "lat_max": grid.lat0 + (grid.n_lat - 0.5) * g, "lon_max": grid.lon0 + (grid.n_lon - 0.5) * g}
+    counts_path = pathlib.Path(daily["rain"].filename).with_name("counts.npy")
+    counts = np.lib.format.open_memmap(counts_path, mode="w+", dtype=np.uint16,
+                                       shape=(len(DAILY_ARRAYS), grid.n_cells, grid.n_days))
+    for name in DAILY_ARRAYS:
+        daily[name][:] = 0.0
+    total = 0
+    with conn.cursor(name="climate_store_weather_record") as cur:
+        cur.itersize = chunk_rows
+        cur.execute(WEATHER_RECORD_QUERY, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            lat, lon, day, tmin, tmax, rain = zip(*rows)
+            cells = grid.cell_index(np.array(lat, dtype=float), np.array(lon, dtype=float))
+            days = grid.day_index(day)
+            ok = (cells >= 0) & (days >= 0) & (days < grid.n_days)
+            for k, (name, values) in enumerate(zip(DAILY_ARRAYS, (tmin, tmax, rain))):
+                values = np.array(values, dtype=float)
+                has = ok & ~np.isnan(values)
+                np.add.at(daily[name], (cells[has], days[has]), values[has])
+                np.add.at(counts[k], (cells[has], days[has]), 1)
+            total += len(rows)
+            if verbose:
+                print(f"  weather_record: {total} rows")
+    for lo in range(0, grid.n_cells, CLIMATE_STORE_CHUNK_CELLS):
+        hi = min(lo + CLIMATE_STORE_CHUNK_CELLS, grid.n_cells)
+        for k, name in enumerate(DAILY_ARRAYS):
+            n = counts[k, lo:hi]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                daily[name][lo:hi] = np.where(n > 0, daily[name][lo:hi] / n, np.nan)
+    del counts
+    counts_path.unlink()
+    return total
+
+
+def fill_from_archive(daily, grid, workers=None, verbose=True):
+    """One archive download per cell covering the whole calendar, several cells in parallel."""
+    end = str(grid.start + grid.n_days - 1)
+    done = [0]
+    lock = threading.Lock()
+
+    def fetch(cell):
+        lat, lon = grid.cell_center(cell)
+        df = fetch_daily(lat, lon, str(grid.start), end)
+        days = grid.day_index(df["date"].to_numpy().astype("datetime64[D]"))
+        ok = (days >= 0) & (days < grid.n_days)
+        daily["tmin"][cell, days[ok]] = df["tmin_c"].to_numpy(dtype=float)[ok]
+        daily["tmax"][cell, days[ok]] = df["tmax_c"].to_numpy(dtype=float)[ok]
+        daily["rain"][cell, days[ok]] = df["rainfall_mm"].to_numpy(dtype=float)[ok]
+        with lock:
+            done[0] += 1
+            if verbose and done[0] % 50 == 0:
+                print(f"  archive: {done[0]}/{grid.n_cells} cells")
+
+    for name in DAILY_ARRAYS:
+        daily[name][:] = np.nan
+    with ThreadPoolExecutor(max_workers=workers or WEATHER_HTTP_POOL_SIZE) as pool:
+        list(pool.map(fetch, range(grid.n_cells)))
+    return grid.n_cells
+
+
+def write_prefix_sums(path, daily, grid, base_temps, chunk_cells=None):
+    """Cumulative sums with a leading zero column, computed a block of cells at a time."""
+    chunk_cells = chunk_cells or CLIMATE_STORE_CHUNK_CELLS
+    names = ["rain_cum", "tmean_cum", "tmean_count_cum", "rain_count_cum"] + [_gdd_name(b) for b in base_temps]
+    cum = {name: np.lib.format.open_memmap(path / f"{name}.npy", mode="w+", dtype=np.float64,
+                                           shape=(grid.n_cells, grid.n_days + 1)) for name in names}
+    for lo in range(0, grid.n_cells, chunk_cells):
+        hi = min(lo + chunk_cells, grid.n_cells)
+        tmean = (daily["tmin"][lo:hi].astype(np.float64) + daily["tmax"][lo:hi]) / 2
+        valid = ~np.isnan(tmean)
+        rain = daily["rain"][lo:hi].astype(np.float64)
+        blocks = {"rain_cum": np.nan_to_num(rain), "rain_count_cum": (~np.isnan(rain)).astype(np.float64),
+                  "tmean_cum": np.where(valid, tmean, 0.0), "tmean_count_cum": valid.astype(np.float64)}
+        for b in base_temps:
+            blocks[_gdd_name(b)] = np.where(valid, np.clip(tmean - b, 0, None), 0.0)
+        for name, block in blocks.items():
+            cum[name][lo:hi, 0] = 0.0
+            np.cumsum(block, axis=1, out=cum[name][lo:hi, 1:])
+    for arr in cum.values():
+        arr.flush()
+
+
+def build_store(path=None, bbox=None, start_date=None, end_date=None, grid_deg=None, base_temps=None,
+                source="weather_record", conn=None, workers=None, verbose=True):
+    """Build the store at `path`, replacing any previous one only once the new one is complete."""
+    path = pathlib.Path(path or CLIMATE_STORE_PATH)
+    base_temps = sorted({float(b) for b in (base_temps or DEFAULT_BASE_TEMPS)})
+    grid = ClimateGrid(*bbox, start_date, end_date, grid_deg)
+    tmp = path.with_name(path.name + ".building")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    start = time.perf_counter()
+    daily = _open_arrays(tmp, grid, "w+")
+    if source == "weather_record":
+        if conn is None:
+            try:
+                from scripts.bulk_load import connect_db
+            except ImportError:
+                from bulk_load import connect_db
+            conn = connect_db()
+        loaded = fill_from_weather_record(daily, grid, conn, verbose=verbose)
+    elif source == "api":
+        loaded = fill_from_archive(daily, grid, workers, verbose)
+    else:
+        raise ValueError(f"Unknown climate store source {source!r}")
+    for arr in daily.values():
+        arr.flush()
+    write_prefix_sums(tmp, daily, grid, base_temps)
+    meta = dict(grid.meta(), base_temps=base_temps, source=source, loaded=loaded,
+                built_at=time.strftime("%Y-%m-%dT%H:%M:%S"), build_seconds=round(time.perf_counter() - start, 2))
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+    del daily
+    if path.exists():
+        shutil.rmtree(path)
+    tmp.replace(path)
+    if verbose:
+        print(f"Climate store {path}: {grid.n_cells} cells x {grid.n_days} days, GDD bases {base_temps}, "
+              f"{meta['build_seconds']}s")
+    return path
+
+
+class ClimateStore:
+    """Read-only, memory-mapped view of a built store."""
+
+    def __init__(self, path=None):
+        self.path = pathlib.Path(path or CLIMATE_STORE_PATH)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        self.grid = ClimateGrid.from_meta(self.meta)
+        self.base_temps = self.meta["base_temps"]
+        load = lambda name: np.load(self.path / f"{name}.npy", mmap_mode="r")
+        self.rain_cum, self.tmean_cum, self.count_cum = load("rain_cum"), load("tmean_cum"), load("tmean_count_cum")
+        self.rain_count_cum = load("rain_count_cum")
+        self.gdd_cum = {float(b): load(_gdd_name(b)) for b in self.base_temps}
+
+    def _windows(self, lats, lons, start_dates, end_dates):
+        cells = np.atleast_1d(self.grid.cell_index(lats, lons))
+        s = np.atleast_1d(self.grid.day_index(start_dates))
+        e = np.atleast_1d(self.grid.day_index(end_dates)) + 1
+        inside = (cells >= 0) & (s >= 0) & (e <= self.grid.n_days) & (e > s)
+        return cells, s, e, inside
+
+    def _valid_days(self, cells, s, e):
+        days = lambda cum: cum[cells, e] - cum[cells, s]
+        return np.minimum(days(self.count_cum), days(self.rain_count_cum))
+
+    def covers(self, lat, lon, start_date, end_date, min_valid_frac=None):
+        """Whether the window is inside the store and has data for at least `min_valid_frac` of its days."""
+        min_valid_frac = CLIMATE_STORE_MIN_VALID_FRAC if min_valid_frac is None else min_valid_frac
+        cells, s, e, inside = self._windows([lat], [lon], [start_date], [end_date])
+        if not inside[0]:
+            return False
+        valid = self._valid_days(cells, s, e)[0]
+        return valid > 0 and valid >= min_valid_frac * (e[0] - s[0])
+
+    def summarize_many(self, lats, lons, start_dates, end_dates, base_temp=10):
+        """Totals for many (coordinate, window) pairs at once; windows are inclusive of both dates.
+
+        Returns arrays keyed like summarize_imd's dict plus `missing_days`, the days per window
+        without temperature or rainfall (their rainfall and GDD count as zero, mean_temp is over the
+        days that have data and NaN if none do). Pairs outside the store's region or calendar
+        raise ValueError.
+        """
+        gdd_cum = self.gdd_cum.get(float(base_temp))
+        if gdd_cum is None:
+            raise ValueError(f"GDD base {base_temp} not in store (has {self.base_temps})")
+        cells, s, e, inside = self._windows(lats, lons, start_dates, end_dates)
+        if not inside.all():
+            raise ValueError(f"{int((~inside).sum())} window(s) outside the climate store's region or dates")
+        window = lambda cum: cum[cells, e] - cum[cells, s]
+        days = window(self.count_cum)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_temp = np.where(days > 0, window(self.tmean_cum) / days, np.nan)
+        return {"total_rainfall_mm": window(self.rain_cum), "gdd": window(gdd_cum), "mean_temp": mean_temp,
+                "missing_days": (e - s) - self._valid_days(cells, s, e)}
+
+    def summarize(self, lat, lon, start_date, end_date, base_temp=10):
+        out = self.summarize_many([lat], [lon], [start_date], [end_date], base_temp)
+        return {k: float(v[0]) for k, v in out.items()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_climate_store():
+    """Process-wide ClimateStore from CLIMATE_STORE_PATH, or None if no store has been built."""
+    global _store
+    with _store_lock:
+        if _store is None and (pathlib.Path(CLIMATE_STORE_PATH) / "meta.json").exists():
+            _store = ClimateStore()
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the gridded climate prefix-sum store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--path", default=CLIMATE_STORE_PATH)
+    build.add_argument("--bbox", nargs=4, type=float, required=True, metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"))
+    build.add_argument("--start", required=True)
+    build.add_argument("--end", default=date.today().isoformat())
+    build.add_argument("--grid-deg", type=float, default=WEATHER_GRID_DEG)
+    build.add_argument("--base-temps", nargs="+", type=float, default=DEFAULT_BASE_TEMPS)
+    build.add_argument("--source", choices=["weather_record", "api"], default="weather_record")
+    build.add_argument("--workers", type=int, help="parallel downloads for --source api")
+    info = sub.add_parser("info")
+    info.add_argument("--path", default=CLIMATE_STORE_PATH)
+    args = parser.parse_args()
+    if args.command == "build":
+        build_store(args.path, args.bbox, args.start, args.end, args.grid_deg, args.base_temps, args.source,
+                    workers=args.workers)
+    else:
+        print(json.dumps(ClimateStore(args.path).meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,34 @@
-﻿import requests
-import pandas as pd
-from datetime import datetime
-
-def fetch_imd_weather(lat, lon, start_date, end_date):
-    """Fetch daily weather data (IMD-style) via Open-Meteo archive API."""
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": start_date,
-        "end_date": end_date,
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum",
-        "timezone": "Asia/Kolkata"
-    }
-    r = requests.get(url, params=params)
-    r.raise_for_status()
-    data = r.json()
-
-    if "daily" not in data:
-        raise ValueError(f"Unexpected API response: {data}")
-
-    daily = data["daily"]
-    df = pd.DataFrame({
-        "date": pd.to_datetime(daily["time"]),
-        "tmax_c": daily["temperature_2m_max"],
-        "tmin_c": daily["temperature_2m_min"],
-        "rainfall_mm": daily["precipitation_sum"]
-    })
-    return df
-
-def summarize_imd(lat, lon, start_date, end_date, base_temp=10):
-    df = fetch_imd_weather(lat, lon, start_date, end_date)
+﻿import os
+
+try:
+    from scripts.weather_cache import fetch_daily, get_weather_cache
+    from scripts.climate_store import get_climate_store
+except ImportError:
+    from weather_cache import fetch_daily, get_weather_cache
+    from climate_store import get_climate_store
+
+# Serve season aggregates from the prefix-sum store (scripts/climate_store.py) when it covers the window
+WEATHER_USE_CLIMATE_STORE = os.getenv("WEATHER_USE_CLIMATE_STORE", "1") == "1"
+
+def fetch_imd_weather(lat, lon, start_date, end_date, use_cache=True):
+    """Fetch daily weather data (IMD-style) via Open-Meteo archive API.
+
+    With `use_cache` the series comes from the shared grid-cell weather cache and only
+    missing days hit the network.
+    """
+    if use_cache:
+        return get_weather_cache().get_daily(lat, lon, start_date, end_date)
+    return fetch_daily(lat, lon, start_date, end_date)
+
+def _store_summary(lat, lon, start_date, end_date, base_temp, use_store):
+    if WEATHER_USE_CLIMATE_STORE if use_store is None else use_store:
+        store = get_climate_store()
+        if store is not None and float(base_temp) in store.gdd_cum and store.covers(lat, lon, start_date, end_date):
+            summary = store.summarize(lat, lon, start_date, end_date, base_temp)
+            return {k: summary[k] for k in ("total_rainfall_mm", "gdd", "mean_temp")}
+    return None
+
+def summarize_daily(df, base_temp=10):
     mean_temp = ((df["tmax_c"] + df["tmin_c"]) / 2).mean()
     df["gdd"] = ((df["tmax_c"] + df["tmin_c"]) / 2 - base_temp).clip(lower=0)
     gdd_sum = df["gdd"].sum()
@@ -41,6 +39,28 @@ def summarize_imd(lat, lon, start_date, end_date, base_temp=10):
         "mean_temp": float(mean_temp)
     }
 
+def summarize_imd(lat, lon, start_date, end_date, base_temp=10, use_cache=True, use_store=None):
+    """Season rainfall, GDD and mean temperature for a coordinate and date window.
+
+    With `use_store` (default WEATHER_USE_CLIMATE_STORE) the totals are two lookups in the climate
+    store; windows, regions or GDD bases it does not hold fall back to the daily series.
+    """
+    summary = _store_summary(lat, lon, start_date, end_date, base_temp, use_store)
+    if summary is not None:
+        return summary
+    return summarize_daily(fetch_imd_weather(lat, lon, start_date, end_date, use_cache=use_cache), base_temp)
+
+async def summarize_imd_async(lat, lon, start_date, end_date, fetch, base_temp=10, use_store=None):
+    """`summarize_imd` through the weather cache without blocking the event loop.
+
+    `fetch(lat, lon, start, end)` is the async upstream fetcher used for days the cache is missing.
+    """
+    summary = _store_summary(lat, lon, start_date, end_date, base_temp, use_store)
+    if summary is not None:
+        return summary
+    df = await get_weather_cache().get_daily_async(lat, lon, start_date, end_date, fetch)
+    return summarize_daily(df, base_temp)
+
 if __name__ == "__main__":
     res = summarize_imd(18.52, 73.85, "2024-06-01", "2024-09-30")
     print(res)
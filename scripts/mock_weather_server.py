@@ -0,0 +1,108 @@
+"""Local stand-in for the Open-Meteo archive API.
+
+Serves recorded responses from a fixtures directory (sliced to the requested dates) or else a
+deterministic synthetic daily series for any (latitude, longitude, date range), and counts
+upstream hits (and logs the requested coordinates and dates), so the weather cache can be exercised without network access:
+
+    python scripts/mock_weather_server.py --port 8765 [--fixtures bench/fixtures/weather]
+    WEATHER_API_URL=http://127.0.0.1:8765/v1/archive python scripts/fetch_imd.py
+"""
+import argparse
+import json
+import math
+import pathlib
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def synthetic_daily(lat, lon, start_date, end_date):
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    doy = [d.timetuple().tm_yday for d in days]
+    tmax = [round(30 + 4 * math.sin(2 * math.pi * (j - 100) / 365) - 0.3 * (lat - 18), 1) for j in doy]
+    tmin = [round(t - 9 - 0.1 * (lon - 73), 1) for t in tmax]
+    rain = [round(max(0.0, 12 * math.sin(2 * math.pi * (j - 150) / 365) + 3 * math.sin(j * 1.7 + lon)), 1)
+            for j in doy]
+    return {
+        "time": [d.isoformat() for d in days],
+        "temperature_2m_max": tmax,
+        "temperature_2m_min": tmin,
+        "precipitation_sum": rain
+    }
+
+
+def fixture_key(lat, lon):
+    return f"{float(lat):.4f}_{float(lon):.4f}"
+
+
+def load_fixtures(fixtures_dir):
+    """Recorded archive responses keyed by fixture_key(latitude, longitude) of each file."""
+    fixtures = {}
+    for path in sorted(pathlib.Path(fixtures_dir).glob("*.json")):
+        data = json.loads(path.read_text())
+        fixtures[fixture_key(data["latitude"], data["longitude"])] = data["daily"]
+    return fixtures
+
+
+def slice_daily(daily, start_date, end_date):
+    keep = [i for i, t in enumerate(daily["time"]) if start_date <= t <= end_date]
+    return {k: [v[i] for i in keep] for k, v in daily.items()}
+
+
+class MockWeatherHandler(BaseHTTPRequestHandler):
+    hits = 0
+    hits_lock = threading.Lock()
+    requests = []  # (latitude, longitude, start_date, end_date) per archive request
+    fixtures = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self._send({"hits": MockWeatherHandler.hits})
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with MockWeatherHandler.hits_lock:
+            MockWeatherHandler.hits += 1
+            MockWeatherHandler.requests.append((q.get("latitude"), q.get("longitude"), q.get("start_date"), q.get("end_date")))
+        try:
+            recorded = MockWeatherHandler.fixtures.get(fixture_key(q["latitude"], q["longitude"]))
+            if recorded is not None and recorded["time"][0] <= q["start_date"] and q["end_date"] <= recorded["time"][-1]:
+                daily = slice_daily(recorded, q["start_date"], q["end_date"])
+            else:
+                daily = synthetic_daily(float(q["latitude"]), float(q["longitude"]), q["start_date"], q["end_date"])
+        except (KeyError, ValueError) as e:
+            return self._send({"error": True, "reason": str(e)}, status=400)
+        self._send({"latitude": float(q["latitude"]), "longitude": float(q["longitude"]), "daily": daily})
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, fixtures_dir=None):
+    """Start the stand-in on a background thread; returns (server, archive_url)."""
+    if fixtures_dir:
+        MockWeatherHandler.fixtures = load_fixtures(fixtures_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockWeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/archive"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="directory of recorded archive responses")
+    args = parser.parse_args()
+    if args.fixtures:
+        MockWeatherHandler.fixtures = load_fixtures(args.fixtures)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockWeatherHandler)
+    print(f"Mock weather API on http://127.0.0.1:{args.port}/v1/archive")
+    server.serve_forever()
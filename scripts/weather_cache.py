@@ -0,0 +1,294 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import time
+import pathlib
+from datetime import date, timedelta
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from metrics import record_cache_lookup
+except ImportError:  # run as a standalone script without the app modules on sys.path
+    record_cache_lookup = None
+
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://archive-api.open-meteo.com/v1/archive")
+WEATHER_CACHE_PATH = os.getenv("WEATHER_CACHE_PATH", "cache/weather_cache.sqlite")
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+WEATHER_CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL_S", str(30 * 24 * 3600)))
+WEATHER_CACHE_MAX_CELLS = int(os.getenv("WEATHER_CACHE_MAX_CELLS", "5000"))
+# Days the archive returned without values are kept only this long, so gaps get filled in later
+WEATHER_CACHE_NULL_TTL_S = float(os.getenv("WEATHER_CACHE_NULL_TTL_S", "3600"))
+# Cache hits only note the access in memory; LRU/TTL sweeps run on misses or at most this often
+WEATHER_CACHE_SWEEP_S = float(os.getenv("WEATHER_CACHE_SWEEP_S", "60"))
+WEATHER_HTTP_POOL_SIZE = int(os.getenv("WEATHER_HTTP_POOL_SIZE", "10"))
+WEATHER_HTTP_TIMEOUT = (5, float(os.getenv("WEATHER_HTTP_TIMEOUT_S", "30")))
+
+DAILY_VARS = "temperature_2m_max,temperature_2m_min,precipitation_sum"
+COLUMNS = ["date", "tmax_c", "tmin_c", "rainfall_mm"]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Process-wide requests session with pooled keep-alive connections and retries."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET"])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=WEATHER_HTTP_POOL_SIZE, max_retries=retry)
+            s = requests.Session()
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+        return _session
+
+
+def _daily_params(lat, lon, start_date, end_date):
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start_date,
+        "end_date": end_date,
+        "daily": DAILY_VARS,
+        "timezone": "Asia/Kolkata"
+    }
+
+
+def _daily_frame(data):
+    if "daily" not in data:
+        raise ValueError(f"Unexpected API response: {data}")
+
+    daily = data["daily"]
+    return pd.DataFrame({
+        "date": pd.to_datetime(daily["time"]),
+        "tmax_c": daily["temperature_2m_max"],
+        "tmin_c": daily["temperature_2m_min"],
+        "rainfall_mm": daily["precipitation_sum"]
+    })
+
+
+def fetch_daily(lat, lon, start_date, end_date, api_url=None):
+    """Fetch daily weather data (IMD-style) via Open-Meteo archive API."""
+    params = _daily_params(lat, lon, start_date, end_date)
+    r = get_http_session().get(api_url or WEATHER_API_URL, params=params, timeout=WEATHER_HTTP_TIMEOUT)
+    r.raise_for_status()
+    return _daily_frame(r.json())
+
+
+async def fetch_daily_async(client, lat, lon, start_date, end_date, api_url=None):
+    """`fetch_daily` on a shared httpx.AsyncClient, which carries the pool limits and timeouts."""
+    r = await client.get(api_url or WEATHER_API_URL, params=_daily_params(lat, lon, start_date, end_date))
+    r.raise_for_status()
+    return _daily_frame(r.json())
+
+
+def _missing_ranges(wanted, have):
+    """Contiguous (start, end) date ranges of `wanted` days that are not in `have`."""
+    ranges = []
+    start = prev = None
+    for d in wanted:
+        if d in have:
+            continue
+        if start is not None and d == prev + timedelta(days=1):
+            prev = d
+            continue
+        if start is not None:
+            ranges.append((start, prev))
+        start = prev = d
+    if start is not None:
+        ranges.append((start, prev))
+    return ranges
+
+
+class WeatherCache:
+    """Disk-backed daily weather cache keyed by grid cell.
+
+    Coordinates are snapped to a `grid_deg` grid and days are stored per cell in SQLite, so
+    nearby fields and overlapping seasons share one upstream download. Only the missing date
+    sub-ranges are fetched, concurrent callers for the same cell wait on a single fetch, days
+    older than `ttl_s` are refetched and the least recently used cells beyond `max_cells` are
+    evicted. Hits stay read-only: access times are buffered and written, together with the
+    eviction sweep, on the next miss or once `sweep_s` has passed. Days with null values expire
+    after `null_ttl_s` instead of `ttl_s`.
+
+    Fetches are single-flight within one process only; prefork workers sharing the SQLite file
+    may each fetch the same missing range once, which INSERT OR REPLACE keeps harmless.
+    """
+
+    def __init__(self, path=None, grid_deg=None, ttl_s=None, max_cells=None, api_url=None, sweep_s=None,
+                 null_ttl_s=None):
+        self.path = path or WEATHER_CACHE_PATH
+        self.grid_deg = grid_deg or WEATHER_GRID_DEG
+        self.ttl_s = WEATHER_CACHE_TTL_S if ttl_s is None else ttl_s
+        self.null_ttl_s = WEATHER_CACHE_NULL_TTL_S if null_ttl_s is None else null_ttl_s
+        self.max_cells = max_cells or WEATHER_CACHE_MAX_CELLS
+        self.api_url = api_url
+        self.sweep_s = WEATHER_CACHE_SWEEP_S if sweep_s is None else sweep_s
+        self._touched = {}
+        self._touched_lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.upstream_requests = 0
+        self._db_lock = threading.Lock()
+        self._cell_locks = {}
+        self._cell_locks_guard = threading.Lock()
+        self._async_cell_locks = {}
+        if self.path != ":memory:":
+            pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_day (
+                  cell_lat REAL, cell_lon REAL, date TEXT,
+                  tmax_c REAL, tmin_c REAL, rainfall_mm REAL, fetched_at REAL,
+                  PRIMARY KEY (cell_lat, cell_lon, date)
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS weather_day_fetched_at ON weather_day (fetched_at)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_cell (
+                  cell_lat REAL, cell_lon REAL, last_access REAL,
+                  PRIMARY KEY (cell_lat, cell_lon)
+                )""")
+
+    def snap(self, lat, lon):
+        g = self.grid_deg
+        return round(round(float(lat) / g) * g, 6), round(round(float(lon) / g) * g, 6)
+
+    def _cell_lock(self, cell):
+        with self._cell_locks_guard:
+            return self._cell_locks.setdefault(cell, threading.Lock())
+
+    def _read(self, cell, start, end):
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT date, tmax_c, tmin_c, rainfall_mm, fetched_at FROM weather_day "
+                "WHERE cell_lat = ? AND cell_lon = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (cell[0], cell[1], start.isoformat(), end.isoformat())).fetchall()
+        cutoff = time.time() - self.ttl_s
+        return [r[:4] for r in rows if r[4] >= cutoff]
+
+    def _write(self, cell, df):
+        now = time.time()
+        # Backdating fetched_at makes incomplete days expire after null_ttl_s through the usual TTL check
+        null_fetched_at = now - max(0.0, self.ttl_s - self.null_ttl_s)
+        rows = [(cell[0], cell[1], d.date().isoformat(), tmax, tmin, rain,
+                 null_fetched_at if pd.isna(tmax) or pd.isna(tmin) or pd.isna(rain) else now)
+                for d, tmax, tmin, rain in df[COLUMNS].itertuples(index=False)]
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO weather_day VALUES (?,?,?,?,?,?,?)", rows)
+
+    def _touch(self, cell, miss):
+        with self._touched_lock:
+            self._touched[cell] = time.time()
+            due = miss or time.monotonic() - self._last_sweep >= self.sweep_s
+        if due:
+            self.sweep()
+
+    def sweep(self):
+        """Write buffered access times, evict LRU cells beyond `max_cells` and drop expired days."""
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+            self._last_sweep = time.monotonic()
+        with self._db_lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO weather_cell VALUES (?,?,?)",
+                                   [(c[0], c[1], t) for c, t in touched.items()])
+            stale = self._conn.execute(
+                "SELECT cell_lat, cell_lon FROM weather_cell ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                (self.max_cells,)).fetchall()
+            for c in stale:
+                self._conn.execute("DELETE FROM weather_day WHERE cell_lat = ? AND cell_lon = ?", c)
+                self._conn.execute("DELETE FROM weather_cell WHERE cell_lat = ? AND cell_lon = ?", c)
+            self._conn.execute("DELETE FROM weather_day WHERE fetched_at < ?", (time.time() - self.ttl_s,))
+        self._drop_cell_locks(stale)
+
+    def _drop_cell_locks(self, cells):
+        """Forget the locks of evicted cells so the lock maps stay bounded by `max_cells`.
+
+        Locks in use are kept; a caller that fetched a lock but has not acquired it yet may then
+        fetch the cell alongside a new caller, which only costs one extra request.
+        """
+        with self._cell_locks_guard:
+            for c in map(tuple, cells):
+                for locks in (self._cell_locks, self._async_cell_locks):
+                    lock = locks.get(c)
+                    if lock is not None and not lock.locked():
+                        del locks[c]
+
+    def _window(self, lat, lon, start_date, end_date):
+        cell = self.snap(lat, lon)
+        start, end = date.fromisoformat(str(start_date)[:10]), date.fromisoformat(str(end_date)[:10])
+        return cell, start, end, [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+    def _lookup(self, cell, start, end, wanted):
+        rows = self._read(cell, start, end)
+        return rows, _missing_ranges(wanted, {date.fromisoformat(r[0]) for r in rows})
+
+    def _finish(self, cell, rows, hit):
+        if hit:
+            self.hits += 1
+        self._touch(cell, not hit)
+        if record_cache_lookup is not None:
+            record_cache_lookup("weather", hit)
+        df = pd.DataFrame(rows, columns=COLUMNS)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def get_daily(self, lat, lon, start_date, end_date):
+        """Daily series for the cell containing (lat, lon), same columns as `fetch_daily`."""
+        cell, start, end, wanted = self._window(lat, lon, start_date, end_date)
+        with self._cell_lock(cell):
+            rows, missing = self._lookup(cell, start, end, wanted)
+            if missing:
+                self.misses += 1
+                for lo, hi in missing:
+                    self.upstream_requests += 1
+                    self._write(cell, fetch_daily(cell[0], cell[1], lo.isoformat(), hi.isoformat(), self.api_url))
+                rows = self._read(cell, start, end)
+            return self._finish(cell, rows, not missing)
+
+    async def get_daily_async(self, lat, lon, start_date, end_date, fetch):
+        """`get_daily` for event-loop callers: SQLite work runs in a thread and missing ranges come
+        from `fetch(lat, lon, start, end)`, an async fetcher such as `fetch_daily_async` bound to a client.
+
+        Concurrent coroutines for the same cell wait on one fetch, as threads do in `get_daily`.
+        """
+        cell, start, end, wanted = self._window(lat, lon, start_date, end_date)
+        async with self._async_cell_lock(cell):
+            rows, missing = await asyncio.to_thread(self._lookup, cell, start, end, wanted)
+            if missing:
+                self.misses += 1
+                for lo, hi in missing:
+                    self.upstream_requests += 1
+                    df = await fetch(cell[0], cell[1], lo.isoformat(), hi.isoformat())
+                    await asyncio.to_thread(self._write, cell, df)
+                rows = await asyncio.to_thread(self._read, cell, start, end)
+            return await asyncio.to_thread(self._finish, cell, rows, not missing)
+
+    def _async_cell_lock(self, cell):
+        with self._cell_locks_guard:
+            return self._async_cell_locks.setdefault(cell, asyncio.Lock())
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "upstream_requests": self.upstream_requests}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_weather_cache():
+    """Process-wide WeatherCache built from the WEATHER_* environment settings."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = WeatherCache()
+        return _cache
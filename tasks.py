@@ -1,5 +1,173 @@
-﻿# ... (Full tasks.py content from previous correct version) ...
-import time, logging, os, traceback; from celery import Celery; from dotenv import load_dotenv; import pandas as pd; from backend_skeleton import featurize_field; from optimizer import optimize_npk_safety_first
-load_dotenv(); CELERY_BROKER_URL = 'redis://redis:6379/0'; CELERY_RESULT_BACKEND = 'redis://redis:6379/0'; celery_app = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND); logging.basicConfig(level=logging.INFO); logger = logging.getLogger(__name__)
+import time, logging, os, traceback
+from celery import Celery
+from celery.signals import task_failure, task_postrun, task_prerun, task_success, worker_init, worker_process_init, worker_process_shutdown
+from dotenv import load_dotenv
+import pandas as pd
+from backend_skeleton import featurize_field, featurize_fields
+from optimizer import optimize_fields, result_from_batch_row
+from yield_model import get_yield_model
+from budget_curve import cached_budget_curve, get_field_curve, interpolate_curve
+from metrics import JOBS_IN_FLIGHT, timed, timings_ms, reset_multiprocess_dir, start_worker_metrics_server, mark_process_dead
+from job_results import batch_result_id, flush_results, publish_job_event, persist_result
+
+load_dotenv()
+CELERY_BROKER_URL = 'redis://redis:6379/0'
+CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+celery_app = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+# Running jobs report STARTED rather than PENDING, so status polls can tell them from unknown ids
+celery_app.conf.task_track_started = True
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def serve_worker_metrics(**kwargs):
+    reset_multiprocess_dir()
+    start_worker_metrics_server(CELERY_BROKER_URL)
+
+
+@worker_process_init.connect
+def warm_yield_model(**kwargs):
+    model = get_yield_model()
+    logger.info(f"[WORKER] Yield model: {model.path if model else 'none, using mock yield model'}")
+
+
+@worker_process_shutdown.connect
+def retire_worker_metrics(pid=None, **kwargs):
+    flush_results()
+    mark_process_dead(pid or os.getpid())
+
+
+# Tasks whose status and result are pushed to clients waiting on /recommend/events/{job_id}
+EVENT_TASKS = {"tasks.run_recommendation_pipeline", "tasks.run_budget_curve_pipeline"}
+
+
+@task_prerun.connect
+def job_started(task_id=None, task=None, **kwargs):
+    JOBS_IN_FLIGHT.labels(task.name).inc()
+    if task.name in EVENT_TASKS:
+        publish_job_event(task_id, "STARTED")
+
+
+@task_success.connect
+def job_succeeded(sender=None, result=None, **kwargs):
+    job_id = sender.request.id
+    if sender.name in EVENT_TASKS:
+        publish_job_event(job_id, "SUCCESS", result)
+    if sender.name == "tasks.run_recommendation_pipeline":
+        persist_result(job_id, result["field_id"], result["crop"], result)
+    elif sender.name == "tasks.run_recommendation_batch_chunk":
+        # Keyed by (batch, field) and tagged with batch_id, so /recommend/batch/{id} can read them back
+        batch_id = sender.request.group or job_id
+        for r in result["results"]:
+            status = "failed" if "error" in r else "completed"
+            persist_result(batch_result_id(batch_id, r["field_id"]), r["field_id"], r["crop"], dict(r, batch_id=batch_id), status)
+
+
+@task_failure.connect
+def job_failed(sender=None, task_id=None, exception=None, args=None, **kwargs):
+    if sender.name in EVENT_TASKS:
+        publish_job_event(task_id, "FAILED", str(exception))
+    if sender.name == "tasks.run_recommendation_pipeline":
+        field_id, budget, crop = (list(args or []) + [None] * 3)[:3]
+        persist_result(task_id, field_id, crop, {"field_id": field_id, "budget": budget, "crop": crop, "error": str(exception)}, status="failed")
+
+
+@task_postrun.connect
+def job_finished(task=None, **kwargs):
+    JOBS_IN_FLIGHT.labels(task.name).dec()
+
+
+def build_response(field_id, budget, crop, X_dict, opt_result):
+    final_mean = opt_result['yield_mean_at_optimum']
+    final_std = max(0, opt_result['yield_std_dev_at_optimum'])
+    ci_half = 1.96 * final_std
+    return {
+        "field_id": field_id, "budget": budget, "crop": crop,
+        "recommended_N": opt_result['N'], "recommended_P": opt_result['P'], "recommended_K": opt_result['K'],
+        "expected_yield_mean": final_mean,
+        "expected_yield_95_ci_low": max(0, final_mean - ci_half),
+        "expected_yield_95_ci_high": final_mean + ci_half,
+        "weather_summary": {"total_rainfall_mm": X_dict.get("total_rainfall"), "gdd": X_dict.get("gdd"), "mean_temp": X_dict.get("mean_temp")},
+        "optimizer_status": opt_result['optimizer_status'],
+        "message": "Optimization successful." if opt_result['N'] > 0 or opt_result['P'] > 0 or opt_result['K'] > 0 else "Optimization failed or budget too low.",
+    }
+
+
 @celery_app.task(name="tasks.run_recommendation_pipeline")
-def run_recommendation_pipeline(field_id: str, budget: float, crop: str) -> dict: logger.info(f"[JOB {celery_app.current_task.request.id}] Start: field={field_id}, crop={crop}, budget={budget}"); try: logger.info(f"[JOB] Calling featurize_field..."); X_df, X_dict = featurize_field(field_id, crop); logger.info(f"[JOB] Features loaded: {list(X_dict.keys())}"); features_for_optimizer = { k: v for k, v in X_dict.items() if k in ['soil_n', 'total_rainfall', 'gdd', 'soil_p', 'soil_k', 'ph'] }; logger.info(f"[JOB] Features for optimizer: {list(features_for_optimizer.keys())}"); logger.info(f"[JOB] Calling optimizer..."); opt_result = optimize_npk_safety_first(budget, features_for_optimizer); logger.info(f"[JOB] Optimizer status: {opt_result['optimizer_status']}"); final_mean = opt_result['yield_mean_at_optimum']; final_std = opt_result['yield_std_dev_at_optimum']; final_std = max(0, final_std); ci_half = 1.96 * final_std; response = {"field_id": field_id, "budget": budget, "crop": crop, "recommended_N": opt_result['N'], "recommended_P": opt_result['P'], "recommended_K": opt_result['K'], "expected_yield_mean": final_mean, "expected_yield_95_ci_low": max(0, final_mean - ci_half), "expected_yield_95_ci_high": final_mean + ci_half, "weather_summary": {"total_rainfall_mm": X_dict.get("total_rainfall"), "gdd": X_dict.get("gdd"), "mean_temp": X_dict.get("mean_temp")}, "optimizer_status": opt_result['optimizer_status'], "message": "Optimization successful." if opt_result['N'] > 0 or opt_result['P'] > 0 or opt_result['K'] > 0 else "Optimization failed or budget too low."}; logger.info(f"[JOB {celery_app.current_task.request.id}] Completed."); return response; except Exception as e: logger.error(f"[JOB FAILED]: {e}"); logger.error(traceback.format_exc()); raise e
+def run_recommendation_pipeline(field_id: str, budget: float, crop: str, mode: str = "solve") -> dict:
+    logger.info(f"[JOB {celery_app.current_task.request.id}] Start: field={field_id}, crop={crop}, budget={budget}, mode={mode}")
+    timings = {}
+    try:
+        with timed("end_to_end", timings):
+            if mode == "curve":
+                curve = get_field_curve(field_id, crop)
+                if curve is None:
+                    logger.info(f"[JOB] Calling featurize_field...")
+                    X_df, X_dict = featurize_field(field_id, crop, timings)
+                    with timed("budget_curve", timings):
+                        curve, hit = cached_budget_curve(X_dict, crop, field_id=field_id)
+                    logger.info(f"[JOB] Budget curve {'hit' if hit else 'computed'}")
+                opt_result = interpolate_curve(curve, budget)
+                weather = curve["weather_summary"]
+                X_dict = {"total_rainfall": weather["total_rainfall_mm"], "gdd": weather["gdd"], "mean_temp": weather["mean_temp"]}
+            else:
+                logger.info(f"[JOB] Calling featurize_field...")
+                X_df, X_dict = featurize_field(field_id, crop, timings)
+                logger.info(f"[JOB] Features loaded: {list(X_dict.keys())}")
+                logger.info(f"[JOB] Calling optimizer...")
+                with timed("optimize", timings):
+                    opt_result = result_from_batch_row(optimize_fields([budget], [X_dict], crop).iloc[0])
+            logger.info(f"[JOB] Optimizer status: {opt_result['optimizer_status']}")
+            response = build_response(field_id, budget, crop, X_dict, opt_result)
+        response["timings_ms"] = timings_ms(timings)
+        logger.info(f"[JOB {celery_app.current_task.request.id}] Completed in {response['timings_ms']['end_to_end']} ms.")
+        return response
+    except Exception as e:
+        logger.error(f"[JOB FAILED]: {e}")
+        logger.error(traceback.format_exc())
+        raise e
+
+
+@celery_app.task(name="tasks.run_budget_curve_pipeline")
+def run_budget_curve_pipeline(field_id: str, crop: str) -> dict:
+    """Whole profit-vs-budget curve for a field, from cache or one batched solve."""
+    logger.info(f"[JOB {celery_app.current_task.request.id}] Budget curve: field={field_id}, crop={crop}")
+    timings = {}
+    with timed("end_to_end", timings):
+        curve = get_field_curve(field_id, crop)
+        if curve is None:
+            X_df, X_dict = featurize_field(field_id, crop, timings)
+            with timed("budget_curve", timings):
+                curve, hit = cached_budget_curve(X_dict, crop, field_id=field_id)
+            logger.info(f"[JOB] Budget curve {'hit' if hit else 'computed'}")
+    return dict(curve, field_id=field_id, timings_ms=timings_ms(timings))
+
+
+@celery_app.task(name="tasks.run_recommendation_batch_chunk")
+def run_recommendation_batch_chunk(field_budgets: list, crop: str) -> dict:
+    """Featurize and optimize one chunk of a batch job: `field_budgets` is a list of [field_id, budget].
+
+    Returns the per-field `results` and the chunk's per-stage `timings_ms`. Fields that cannot be
+    featurized are reported with an "error" entry instead of failing the chunk.
+    """
+    job_id = celery_app.current_task.request.id
+    logger.info(f"[CHUNK {job_id}] Start: {len(field_budgets)} fields, crop={crop}")
+    timings = {}
+    with timed("batch_chunk", timings):
+        features, errors = featurize_fields([field_id for field_id, _ in field_budgets], crop, timings)
+        results, ok_rows = [], []
+        for field_id, budget in field_budgets:
+            if field_id not in features:
+                logger.warning(f"[CHUNK {job_id}] Featurize failed for {field_id}: {errors.get(field_id)}")
+                results.append({"field_id": field_id, "budget": budget, "crop": crop, "error": errors.get(field_id)})
+                continue
+            ok_rows.append((len(results), field_id, budget, features[field_id]))
+            results.append(None)
+        if ok_rows:
+            with timed("optimize_batch", timings):
+                opt_df = optimize_fields([budget for _, _, budget, _ in ok_rows], [X_dict for _, _, _, X_dict in ok_rows], crop)
+            for (pos, field_id, budget, X_dict), row in zip(ok_rows, opt_df.to_dict(orient="records")):
+                results[pos] = build_response(field_id, budget, crop, X_dict, result_from_batch_row(row))
+    logger.info(f"[CHUNK {job_id}] Completed: {len(ok_rows)}/{len(field_budgets)} optimized, timings_ms={timings_ms(timings)}")
+    return {"results": results, "timings_ms": timings_ms(timings)}
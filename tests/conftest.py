@@ -0,0 +1,17 @@
+import pathlib
+import sys
+
+import pytest
+
+# Tests import the app modules the way the services do, from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from scripts.mock_weather_server import start_server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def api_url():
+    """Archive URL of the local weather API stand-in."""
+    server, url = start_server()
+    yield url
+    server.shutdown()
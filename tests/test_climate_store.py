@@ -0,0 +1,38 @@
+"""Climate store cells and aggregates against the weather cache they are meant to mirror."""
+import numpy as np
+import pytest
+
+import scripts.weather_cache
+from scripts.climate_store import ClimateGrid, ClimateStore, build_store
+from scripts.fetch_imd import summarize_daily
+from scripts.weather_cache import WeatherCache
+
+# Half-grid coordinates sit on a rounding boundary, where float error decides the cell
+HALF_GRID_LATS = [round(17.05 + 0.1 * k, 2) for k in range(40)]
+HALF_GRID_LONS = [round(72.05 + 0.1 * k, 2) for k in range(40)]
+
+
+def test_cells_match_weather_cache_snapping(tmp_path):
+    grid = ClimateGrid(17.0, 21.0, 72.0, 76.0, "2024-01-01", "2024-01-31", grid_deg=0.1)
+    cache = WeatherCache(path=str(tmp_path / "weather_cache.sqlite"), grid_deg=0.1)
+    lats, lons = np.meshgrid(HALF_GRID_LATS + [20.25], HALF_GRID_LONS + [73.85])
+    cells = grid.cell_index(lats.ravel(), lons.ravel())
+    assert (cells >= 0).all()
+    for lat, lon, cell in zip(lats.ravel(), lons.ravel(), cells):
+        assert grid.cell_center(cell) == cache.snap(lat, lon), (lat, lon)
+
+
+def test_store_summaries_match_cached_daily_series(tmp_path, api_url, monkeypatch):
+    monkeypatch.setattr(scripts.weather_cache, "WEATHER_API_URL", api_url)
+    start, end = "2024-06-01", "2024-06-30"
+    path = build_store(tmp_path / "climate_store", (20.0, 20.4, 73.8, 74.0), start, end, grid_deg=0.1,
+                       source="api", workers=4, verbose=False)
+    store = ClimateStore(path)
+    cache = WeatherCache(path=str(tmp_path / "weather_cache.sqlite"), grid_deg=0.1, api_url=api_url)
+    for lat in (20.05, 20.15, 20.25, 20.35):
+        for lon in (73.85, 73.95):
+            assert store.covers(lat, lon, start, end)
+            expected = summarize_daily(cache.get_daily(lat, lon, start, end))
+            summary = store.summarize(lat, lon, start, end)
+            for key, value in expected.items():
+                assert summary[key] == pytest.approx(value, abs=1e-3), (lat, lon, key)
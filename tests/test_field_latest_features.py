@@ -0,0 +1,80 @@
+"""field_latest_features triggers against a real PostGIS database.
+
+Set TEST_DATABASE_URL (a libpq URL for a database with PostGIS available) to run; schema.sql is
+applied to a scratch schema that is dropped afterwards.
+"""
+import os
+import pathlib
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA_SQL = pathlib.Path(__file__).resolve().parents[1] / "schema.sql"
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture
+def cur():
+    schema = f"flf_test_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    c = conn.cursor()
+    c.execute(f"CREATE SCHEMA {schema}")
+    c.execute(f"SET search_path TO {schema}, public")
+    c.execute(SCHEMA_SQL.read_text(encoding="utf-8-sig"))
+    yield c
+    c.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.close()
+
+
+def add_field(cur):
+    cur.execute("INSERT INTO field (name) VALUES ('test') RETURNING id")
+    return cur.fetchone()[0]
+
+
+def add_season(cur, field_id, year, ph):
+    cur.execute("INSERT INTO growing_season (field_id, season_year, crop, soil_snapshot) "
+                "VALUES (%s, %s, 'wheat', jsonb_build_object('ph', %s)) RETURNING id", (field_id, year, ph))
+    return cur.fetchone()[0]
+
+
+def latest(cur, field_id):
+    cur.execute("SELECT season_year, ph FROM field_latest_features WHERE field_id = %s", (field_id,))
+    return cur.fetchone()
+
+
+def test_insert_keeps_newest_season(cur):
+    field_id = add_field(cur)
+    add_season(cur, field_id, 2023, 7.0)
+    add_season(cur, field_id, 2021, 6.0)
+    assert latest(cur, field_id) == (2023, 7.0)
+
+
+def test_deleting_latest_season_falls_back_to_previous(cur):
+    field_id = add_field(cur)
+    add_season(cur, field_id, 2022, 6.5)
+    newest = add_season(cur, field_id, 2023, 7.0)
+    cur.execute("DELETE FROM growing_season WHERE id = %s", (newest,))
+    assert latest(cur, field_id) == (2022, 6.5)
+    cur.execute("DELETE FROM growing_season WHERE field_id = %s", (field_id,))
+    assert latest(cur, field_id) is None
+
+
+def test_downward_year_correction_recomputes_latest(cur):
+    field_id = add_field(cur)
+    add_season(cur, field_id, 2022, 6.5)
+    wrong = add_season(cur, field_id, 2024, 7.0)
+    cur.execute("UPDATE growing_season SET season_year = 2020 WHERE id = %s", (wrong,))
+    assert latest(cur, field_id) == (2022, 6.5)
+
+
+def test_moving_season_to_another_field_updates_both(cur):
+    old_field, new_field = add_field(cur), add_field(cur)
+    season = add_season(cur, old_field, 2023, 7.0)
+    cur.execute("UPDATE growing_season SET field_id = %s WHERE id = %s", (new_field, season))
+    assert latest(cur, old_field) is None
+    assert latest(cur, new_field) == (2023, 7.0)
@@ -0,0 +1,91 @@
+"""Batch safety-first optimizer against scipy's SLSQP on the same objective, bounds and budget."""
+import numpy as np
+import pytest
+from scipy.optimize import Bounds, LinearConstraint, minimize
+
+from optimizer import (BASE_UNCERTAINTY, N_RISK_PER_KG, NPK_LOWER_BOUNDS, NPK_UPPER_BOUNDS, Z_5TH_PERCENTILE,
+                       mock_yield_model, optimize_npk_batch, optimize_npk_safety_first)
+
+# Prices at which every nutrient pays off, so small budgets bind on cost and large ones on the bounds
+CROP_PRICE = 100.0
+COSTS = np.array([10.0, 20.0, 5.0])
+FEATURES = [
+    {"soil_n": 25.0, "total_rainfall": 500.0, "gdd": 1500.0},
+    {"soil_n": 60.0, "total_rainfall": 1200.0, "gdd": 2600.0},
+    {"soil_n": 10.0, "total_rainfall": 250.0, "gdd": 900.0},
+]
+BUDGETS = [0.0, 150.0, 1500.0, 4000.0, 1e6]
+
+
+def profit(npk, features, crop_price=CROP_PRICE, costs=COSTS):
+    """5th-percentile profit written out from the scalar mock yield model."""
+    n, p, k = npk
+    mean = mock_yield_model(n, p, k, features)
+    std = mean * (BASE_UNCERTAINTY + n * N_RISK_PER_KG)
+    return crop_price * (mean - Z_5TH_PERCENTILE * std) - float(np.dot(costs, npk))
+
+
+def slsqp_optimum(budget, features, crop_price=CROP_PRICE, costs=COSTS):
+    """Best feasible SLSQP solution over a few starting points.
+
+    SLSQP can stop slightly outside the budget (e.g. spending 152.6 of 150), which would make it
+    look better than a solver that stays feasible, so such results are skipped.
+    """
+    constraint = LinearConstraint([costs], [0], [budget])
+    bounds = Bounds(NPK_LOWER_BOUNDS, NPK_UPPER_BOUNDS)
+    best = None
+    for share in ([0.4, 0.3, 0.3], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]):
+        x0 = np.minimum(NPK_UPPER_BOUNDS, budget * np.array(share) / costs) * 0.95
+        res = minimize(lambda x: -profit(x, features, crop_price, costs), x0, method="SLSQP", bounds=bounds,
+                       constraints=[constraint], options={"maxiter": 500, "ftol": 1e-10})
+        feasible = costs @ res.x <= budget + 1e-6 and (res.x >= NPK_LOWER_BOUNDS - 1e-9).all() \
+            and (res.x <= NPK_UPPER_BOUNDS + 1e-9).all()
+        if feasible and (best is None or res.fun < best.fun):
+            best = res
+    assert best is not None, f"SLSQP found no feasible optimum for budget {budget}"
+    return best.x, -best.fun
+
+
+def solve_grid(crop_price=CROP_PRICE, costs=COSTS):
+    cases = [(b, f) for f in FEATURES for b in BUDGETS]
+    df = optimize_npk_batch([b for b, _ in cases], [f for _, f in cases], crop_price=crop_price, costs=costs)
+    return cases, df
+
+
+def test_batch_matches_slsqp_objective():
+    cases, df = solve_grid()
+    assert df["success"].all()
+    for (budget, features), row in zip(cases, df.to_dict(orient="records")):
+        x = np.array([row["N"], row["P"], row["K"]])
+        _, expected = slsqp_optimum(budget, features)
+        assert profit(x, features) == pytest.approx(expected, rel=1e-4, abs=0.05), (budget, features)
+
+
+def test_batch_respects_bounds_and_budget():
+    cases, df = solve_grid()
+    x = df[["N", "P", "K"]].to_numpy()
+    budgets = np.array([b for b, _ in cases])
+    assert (x >= NPK_LOWER_BOUNDS - 1e-9).all()
+    assert (x <= NPK_UPPER_BOUNDS + 1e-9).all()
+    assert (x @ COSTS <= budgets * (1 + 1e-9) + 1e-6).all()
+
+
+def test_binding_cases_are_exercised():
+    cases, df = solve_grid()
+    x = df[["N", "P", "K"]].to_numpy()
+    spend = x @ COSTS
+    budgets = np.array([b for b, _ in cases])
+    # Small budgets are spent in full; an unlimited budget stops at the upper bounds of paying nutrients
+    assert np.allclose(spend[budgets == 150.0], 150.0, rtol=1e-6)
+    assert np.isclose(x[budgets == 1e6][:, 2], NPK_UPPER_BOUNDS[2]).all()
+    assert (spend[budgets == 1e6] < 1e6).all()
+
+
+def test_scalar_wrapper_matches_slsqp_at_default_prices():
+    features = FEATURES[1]
+    for budget in (500.0, 10000.0):
+        result = optimize_npk_safety_first(budget, features)
+        x = np.array([result["N"], result["P"], result["K"]])
+        costs = np.array([40.0, 80.0, 30.0])
+        _, expected = slsqp_optimum(budget, features, crop_price=20.0, costs=costs)
+        assert profit(x, features, 20.0, costs) == pytest.approx(expected, rel=1e-3, abs=0.5)
@@ -0,0 +1,146 @@
+"""WeatherCache against the local archive stand-in, counting upstream requests."""
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import scripts.weather_cache
+from scripts.mock_weather_server import MockWeatherHandler
+from scripts.weather_cache import WeatherCache, fetch_daily_async
+
+
+@pytest.fixture
+def upstream():
+    with MockWeatherHandler.hits_lock:
+        MockWeatherHandler.hits = 0
+        MockWeatherHandler.requests = []
+    return MockWeatherHandler
+
+
+@pytest.fixture
+def make_cache(tmp_path, api_url):
+    def make(**kwargs):
+        return WeatherCache(path=str(tmp_path / "weather_cache.sqlite"), grid_deg=0.1, api_url=api_url, **kwargs)
+    return make
+
+
+def test_repeat_request_hits_upstream_once(make_cache, upstream):
+    cache = make_cache()
+    first = cache.get_daily(18.52, 73.88, "2024-06-01", "2024-09-30")
+    second = cache.get_daily(18.52, 73.88, "2024-06-01", "2024-09-30")
+    # A nearby field in the same grid cell is served from the cache too
+    third = cache.get_daily(18.49, 73.91, "2024-07-01", "2024-07-31")
+    assert upstream.hits == 1
+    assert len(first) == len(second) == 122 and len(third) == 31
+    assert first.equals(second)
+    assert cache.stats() == {"hits": 2, "misses": 1, "upstream_requests": 1}
+
+
+def test_partial_overlap_fetches_only_missing_range(make_cache, upstream):
+    cache = make_cache()
+    cache.get_daily(18.5, 73.9, "2024-01-01", "2024-01-31")
+    df = cache.get_daily(18.5, 73.9, "2024-01-15", "2024-02-10")
+    assert upstream.hits == 2
+    assert upstream.requests[-1][2:] == ("2024-02-01", "2024-02-10")
+    assert len(df) == 27
+    assert df["date"].is_monotonic_increasing
+
+
+def test_concurrent_same_cell_callers_share_one_fetch(make_cache, upstream):
+    cache = make_cache()
+    barrier = threading.Barrier(8)
+    sizes = []
+
+    def worker(i):
+        barrier.wait()
+        sizes.append(len(cache.get_daily(18.5 + i * 0.001, 73.9, "2023-06-01", "2023-10-31")))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert upstream.hits == 1
+    assert sizes == [153] * 8
+
+
+def test_async_callers_share_one_fetch(make_cache, upstream):
+    cache = make_cache()
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            fetch = lambda lat, lon, start, end: fetch_daily_async(client, lat, lon, start, end, cache.api_url)
+            return await asyncio.gather(*[cache.get_daily_async(18.5, 73.9, "2023-06-01", "2023-06-30", fetch)
+                                          for _ in range(10)])
+
+    frames = asyncio.run(run())
+    assert upstream.hits == 1
+    assert all(len(df) == 30 for df in frames)
+
+
+def test_expired_days_are_refetched(make_cache, upstream):
+    cache = make_cache(ttl_s=0.5)
+    cache.get_daily(18.5, 73.9, "2024-03-01", "2024-03-10")
+    cache.get_daily(18.5, 73.9, "2024-03-01", "2024-03-10")
+    assert upstream.hits == 1
+    time.sleep(0.6)
+    cache.get_daily(18.5, 73.9, "2024-03-01", "2024-03-10")
+    assert upstream.hits == 2
+    assert upstream.requests[-1][2:] == ("2024-03-01", "2024-03-10")
+
+
+def test_least_recently_used_cells_are_evicted(make_cache, upstream):
+    cache = make_cache(max_cells=2)
+    cells = [(18.5, 73.9), (18.7, 73.9), (18.9, 73.9)]
+    for lat, lon in cells:
+        cache.get_daily(lat, lon, "2024-01-01", "2024-01-10")
+        time.sleep(0.01)
+    assert upstream.hits == 3
+    # The third miss swept out the first cell; the two most recent are still cached
+    cache.get_daily(*cells[2], "2024-01-01", "2024-01-10")
+    cache.get_daily(*cells[1], "2024-01-01", "2024-01-10")
+    assert upstream.hits == 3
+    cache.get_daily(*cells[0], "2024-01-01", "2024-01-10")
+    assert upstream.hits == 4
+
+
+def test_hits_defer_access_writes_until_sweep(make_cache, upstream):
+    cache = make_cache(sweep_s=3600)
+    cache.get_daily(18.5, 73.9, "2024-01-01", "2024-01-10")
+    read_access = lambda: cache._conn.execute("SELECT last_access FROM weather_cell").fetchall()
+    written = read_access()
+    time.sleep(0.01)
+    cache.get_daily(18.5, 73.9, "2024-01-01", "2024-01-10")
+    assert read_access() == written
+    cache.sweep()
+    assert read_access()[0][0] > written[0][0]
+
+
+def test_evicted_cells_release_their_locks(make_cache, upstream):
+    cache = make_cache(max_cells=2)
+    for lat in (18.5, 18.7, 18.9, 19.1):
+        cache.get_daily(lat, 73.9, "2024-01-01", "2024-01-10")
+        time.sleep(0.01)
+    assert set(cache._cell_locks) == {cache.snap(18.9, 73.9), cache.snap(19.1, 73.9)}
+
+
+def test_null_days_expire_after_null_ttl(make_cache, upstream, monkeypatch):
+    real_fetch = scripts.weather_cache.fetch_daily
+
+    def fetch_with_gap(lat, lon, start_date, end_date, api_url=None):
+        df = real_fetch(lat, lon, start_date, end_date, api_url)
+        df.loc[df["date"] == "2024-05-05", "rainfall_mm"] = None
+        return df
+
+    monkeypatch.setattr(scripts.weather_cache, "fetch_daily", fetch_with_gap)
+    cache = make_cache(null_ttl_s=0.5)
+    cache.get_daily(18.5, 73.9, "2024-05-01", "2024-05-10")
+    cache.get_daily(18.5, 73.9, "2024-05-01", "2024-05-10")
+    assert upstream.hits == 1
+    time.sleep(0.6)
+    df = cache.get_daily(18.5, 73.9, "2024-05-01", "2024-05-10")
+    assert upstream.hits == 2
+    assert upstream.requests[-1][2:] == ("2024-05-05", "2024-05-05")
+    assert len(df) == 10
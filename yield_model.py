@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import pathlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+YIELD_MODEL_PATH = os.getenv("YIELD_MODEL_PATH", "models/xgb_baseline.joblib")
+YIELD_MODEL_RELOAD_CHECK_S = float(os.getenv("YIELD_MODEL_RELOAD_CHECK_S", "30"))
+
+# Must match ml/train_baseline.featurize: numeric columns, applied NPK, then crop_<name> one-hots
+BASE_FEATURES = ['soil_n', 'soil_p', 'soil_k', 'ph', 'total_rainfall', 'gdd', 'mean_ndvi']
+NPK_FEATURES = ['fert_n', 'fert_p', 'fert_k']
+
+
+def feature_schema_path(model_path):
+    return pathlib.Path(model_path).with_suffix(".features.json")
+
+
+def npk_supported(feature_columns, npk_std):
+    """Whether applied NPK can steer the optimizer: fert_* columns present and varied in training data."""
+    return all(c in feature_columns for c in NPK_FEATURES) and all(npk_std.get(c, 0.0) > 0 for c in NPK_FEATURES)
+
+
+def model_version(path=None):
+    """Version of the model on disk without loading it: [path, mtime] if it supports NPK, else "mock".
+
+    Matches YieldModel.version once a process has loaded that file, so processes that never load
+    the model (the API) can still tell which model a cached result was computed with.
+    """
+    path = str(path or YIELD_MODEL_PATH)
+    try:
+        mtime = os.stat(path).st_mtime
+        schema = json.loads(feature_schema_path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        return "mock"
+    return [path, mtime] if npk_supported(schema.get("feature_columns", []), schema.get("npk_std", {})) else "mock"
+
+
+class YieldModel:
+    """A trained yield regressor plus the exact feature column order it was fitted on."""
+
+    def __init__(self, path):
+        import joblib
+        self.path = str(path)
+        self.mtime = os.stat(self.path).st_mtime
+        self.model = joblib.load(self.path)
+        schema_path = feature_schema_path(self.path)
+        schema = json.loads(schema_path.read_text()) if schema_path.exists() else {}
+        if schema:
+            self.feature_columns = schema["feature_columns"]
+        elif hasattr(self.model, "feature_names_in_"):
+            self.feature_columns = list(self.model.feature_names_in_)
+        else:
+            self.feature_columns = list(self.model.get_booster().feature_names)
+        self._col = {c: i for i, c in enumerate(self.feature_columns)}
+        # Applied NPK only steers the optimizer if it varied in the training data; a model fitted on
+        # constant (e.g. all-missing) fert_* columns predicts the same yield for every candidate
+        npk_std = schema.get("npk_std", {})
+        has_npk = all(c in self._col for c in NPK_FEATURES)
+        self.supports_npk = npk_supported(self._col, npk_std)
+        if has_npk and not self.supports_npk:
+            logger.warning(f"[YieldModel] {self.path} has no applied-NPK variation recorded ({npk_std}); "
+                           f"using the mock yield model for NPK optimization")
+        logger.info(f"[YieldModel] Loaded {self.path}: {len(self.feature_columns)} features, npk={self.supports_npk}")
+
+    @property
+    def version(self):
+        return [self.path, self.mtime] if self.supports_npk else "mock"
+
+    def base_matrix(self, feature_dicts, crops):
+        """(B, F) matrix of per-field features in model column order; applied NPK left at zero."""
+        X = np.zeros((len(feature_dicts), len(self.feature_columns)), dtype=np.float32)
+        for i, (features, crop) in enumerate(zip(feature_dicts, crops)):
+            for name in BASE_FEATURES:
+                value = features.get(name)
+                if name in self._col and value is not None and not pd.isna(value):
+                    X[i, self._col[name]] = value
+            crop_col = self._col.get(f"crop_{crop}")
+            if crop_col is not None:
+                X[i, crop_col] = 1.0
+        return X
+
+    def predict_candidates(self, base, npk, field_idx):
+        """Score every (field_idx[j], npk[j]) candidate with a single predict call."""
+        X = base[field_idx]
+        for j, name in enumerate(NPK_FEATURES):
+            X[:, self._col[name]] = npk[:, j]
+        return np.asarray(self.model.predict(pd.DataFrame(X, columns=self.feature_columns)), dtype=float)
+
+
+_model = None
+_last_check = float("-inf")
+_lock = threading.Lock()
+
+
+def get_yield_model(path=None):
+    """Process-wide warm model; reloaded when the file on disk changes, None if there is no model.
+
+    The file is stat'ed at most every YIELD_MODEL_RELOAD_CHECK_S seconds, so new artifacts are
+    picked up without restarting workers and a failed reload keeps serving the old model.
+    """
+    global _model, _last_check
+    path = path or YIELD_MODEL_PATH
+    now = time.monotonic()
+    if now - _last_check < YIELD_MODEL_RELOAD_CHECK_S and (_model is None or _model.path == str(path)):
+        return _model
+    with _lock:
+        _last_check = now
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            if _model is not None:
+                logger.warning(f"[YieldModel] {path} disappeared; keeping loaded model")
+            return _model
+        if _model is None or _model.path != str(path) or mtime != _model.mtime:
+            try:
+                _model = YieldModel(path)
+            except Exception as e:
+                logger.error(f"[YieldModel] Failed to load {path}: {e}")
+        return _model